@@ -15,12 +15,13 @@
         - Trazabilidad completa del proceso
     """,
     "author": "Easy Technology Services",
-    "depends": ["base", "account"],
+    "depends": ["base", "account", "bus"],
     "external_dependencies": {
-        "python": ["pandas", "openpyxl"]
+        "python": ["openpyxl"]
     },
             "data": [
                 "security/ir.model.access.csv",
+                "data/ir_cron_data.xml",
                 "views/invoice_import_views.xml",
                 "views/invoice_import_wizard_views.xml",
                 "views/account_move_views.xml",
@@ -1,5 +1,8 @@
 from . import invoice_import
 from . import invoice_import_line
+from . import invoice_import_job
+from . import invoice_import_stat
+from . import invoice_import_progress
 from . import invoice_import_wizard
 from . import account_move_line
 
@@ -1,5 +1,22 @@
-from odoo import models, fields, api, _
+import cProfile
+import logging
+import marshal
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import psycopg2
+
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools.misc import format_datetime
+
+from ..tools import file_reader, line_normalizer
+from ..tools.date_parser import DateParser
+from ..tools.stage_timer import StageTimer
+
+_logger = logging.getLogger(__name__)
 
 
 class InvoiceImport(models.Model):
@@ -7,6 +24,16 @@ class InvoiceImport(models.Model):
     _description = 'Importación Masiva de Facturas'
     _order = 'create_date desc'
 
+    # Cantidad de filas leídas y creadas por lote
+    _staging_batch_size = 1000
+
+    # Segundos mínimos entre dos avisos de avance y espera máxima por bloqueos al guardarlos
+    _progress_interval = 5
+    _progress_lock_timeout = '1s'
+
+    # Prefijo del nombre de los adjuntos con perfiles de cProfile
+    _profile_attachment_prefix = 'perfil_importacion_'
+
     name = fields.Char(
         string='Nombre',
         required=True,
@@ -23,9 +50,34 @@ class InvoiceImport(models.Model):
         ('csv', 'CSV (.csv)')
     ], string='Tipo de archivo', readonly=True)
     
+    attachment_id = fields.Many2one(
+        'ir.attachment',
+        string='Archivo',
+        readonly=True,
+        copy=False,
+        help='Archivo cargado, guardado como adjunto de la importación'
+    )
+    
+    reader_engine = fields.Selection([
+        ('auto', 'Automático'),
+        ('native', 'Nativo (csv / openpyxl)'),
+        ('pandas', 'pandas')
+    ], string='Motor de lectura', default='auto', required=True,
+        help='Automático: lector nativo, salvo los CSV grandes que se leen con pandas si está instalado'
+    )
+    
+    file_hash = fields.Char(
+        string='Huella del archivo',
+        readonly=True,
+        index=True,
+        copy=False,
+        help='SHA-256 del contenido del archivo, para reconocer cargas repetidas del mismo archivo'
+    )
+    
     state = fields.Selection([
         ('draft', 'Borrador'),
         ('validated', 'Validado'),
+        ('processing', 'En proceso'),
         ('imported', 'Importado'),
         ('error', 'Error')
     ], string='Estado', default='draft', readonly=True)
@@ -50,20 +102,145 @@ class InvoiceImport(models.Model):
         readonly=True
     )
     
+    skipped_lines = fields.Integer(
+        string='Líneas omitidas',
+        readonly=True,
+        help='Líneas de documentos que ya habían sido importados'
+    )
+    
+    skip_duplicates = fields.Boolean(
+        string='Omitir documentos ya importados',
+        default=True,
+        help='No crear los documentos cuyo número fiscal o referencia ya existe en la compañía'
+    )
+    
+    processed_lines = fields.Integer(
+        string='Líneas procesadas',
+        readonly=True
+    )
+    
+    last_processed_line = fields.Integer(
+        string='Última línea procesada',
+        readonly=True,
+        help='Número de la última línea del último bloque confirmado (punto de control)'
+    )
+    
+    checkpoint_date = fields.Datetime(
+        string='Fecha del punto de control',
+        readonly=True
+    )
+    
+    worker_count = fields.Integer(
+        string='Particiones',
+        default=1,
+        help='Cantidad de particiones que pueden procesar en paralelo varios trabajadores en segundo plano. '
+             'Un documento nunca queda repartido entre particiones'
+    )
+    
+    job_ids = fields.One2many(
+        'invoice.import.job',
+        'import_id',
+        string='Particiones en proceso'
+    )
+    
+    chunk_size = fields.Integer(
+        string='Tamaño de bloque',
+        default=500,
+        help='Cantidad aproximada de líneas procesadas por bloque. En segundo plano se confirma la transacción después de cada bloque'
+    )
+    
     total_discount_amount = fields.Float(
         string='Total Descuentos',
-        compute='_compute_total_discounts',
-        store=True,
+        readonly=True,
         help='Total de descuentos aplicados en todas las líneas'
     )
     
     total_discount_percentage = fields.Float(
         string='Descuento Promedio (%)',
-        compute='_compute_total_discounts',
-        store=True,
+        readonly=True,
         help='Porcentaje promedio de descuento aplicado'
     )
     
+    created_partner_ids = fields.Many2many(
+        'res.partner',
+        'invoice_import_created_partner_rel',
+        'import_id',
+        'partner_id',
+        string='Clientes creados',
+        readonly=True
+    )
+    
+    created_product_ids = fields.Many2many(
+        'product.product',
+        'invoice_import_created_product_rel',
+        'import_id',
+        'product_id',
+        string='Productos creados',
+        readonly=True
+    )
+    
+    created_partner_count = fields.Integer(
+        string='Clientes creados',
+        compute='_compute_created_counts'
+    )
+    
+    created_product_count = fields.Integer(
+        string='Productos creados',
+        compute='_compute_created_counts'
+    )
+    
+    profile = fields.Boolean(
+        string='Perfilar el procesamiento',
+        groups='account.group_account_manager',
+        help='Ejecutar el procesamiento con cProfile y adjuntar las estadísticas (archivo .prof de pstats). '
+             'En segundo plano se perfila cada ejecución del planificador; no se perfilan los trabajadores de particiones'
+    )
+    
+    profile_attachment_ids = fields.Many2many(
+        'ir.attachment',
+        string='Perfiles',
+        compute='_compute_profile_attachment_ids',
+        groups='account.group_account_manager'
+    )
+    
+    progress_stage = fields.Selection(
+        related='progress_id.stage',
+        string='Etapa actual'
+    )
+    
+    progress_id = fields.Many2one(
+        'invoice.import.progress',
+        string='Avance',
+        compute='_compute_progress_id'
+    )
+    
+    progress_percentage = fields.Float(
+        related='progress_id.percentage',
+        string='Avance (%)'
+    )
+    
+    progress_lines_per_second = fields.Float(
+        related='progress_id.lines_per_second',
+        string='Líneas por segundo'
+    )
+    
+    progress_eta = fields.Datetime(
+        related='progress_id.eta',
+        string='Fin estimado'
+    )
+    
+    stat_ids = fields.One2many(
+        'invoice.import.stat',
+        'import_id',
+        string='Estadísticas por etapa',
+        readonly=True
+    )
+    
+    stage_summary = fields.Text(
+        string='Tiempos por etapa',
+        compute='_compute_stage_summary'
+    )
+    
     import_line_ids = fields.One2many(
         'invoice.import.line',
         'import_id',
@@ -82,32 +259,639 @@ class InvoiceImport(models.Model):
         required=True
     )
     
-    @api.depends('import_line_ids.monto_descuento_aplicado', 'import_line_ids.descuento_aplicado')
-    def _compute_total_discounts(self):
-        """Calcular el total de descuentos aplicados"""
+    journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario de ventas',
+        domain="[('type', '=', 'sale'), ('company_id', '=', company_id)]",
+        help='Diario para las facturas. Si se deja vacío se usa el primer diario de ventas de la compañía'
+    )
+    
+    refund_journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario de notas de crédito',
+        domain="[('type', '=', 'sale'), ('company_id', '=', company_id)]",
+        help='Diario para las notas de crédito. Si se deja vacío se usa el diario de ventas'
+    )
+    
+    @api.depends('created_partner_ids', 'created_product_ids')
+    def _compute_created_counts(self):
+        """Contar los clientes y productos creados por la importación"""
+        for record in self:
+            record.created_partner_count = len(record.created_partner_ids)
+            record.created_product_count = len(record.created_product_ids)
+
+    @api.depends('stat_ids.seconds', 'stat_ids.query_count', 'stat_ids.row_count')
+    def _compute_stage_summary(self):
+        """Resumir las mediciones de cada etapa (sumando bloques y particiones)"""
+        stages = dict(self.env['invoice.import.stat']._fields['stage']._description_selection(self.env))
+        groups = self.env['invoice.import.stat']._read_group(
+            [('import_id', 'in', self.ids)],
+            ['import_id', 'stage'],
+            ['seconds:sum', 'query_count:sum', 'row_count:sum'],
+        )
+        summaries = {}
+        for import_record, stage, seconds, query_count, row_count in groups:
+            rows_per_second = row_count / seconds if seconds else 0.0
+            summaries.setdefault(import_record.id, []).append(
+                _('%s: %.3f s, %d consultas, %d filas (%.1f filas/s)')
+                % (stages.get(stage, stage), seconds, query_count, row_count, rows_per_second)
+            )
         for record in self:
-            total_discount_amount = 0.0
-            total_discount_percentage = 0.0
-            lines_with_discount = 0
+            record.stage_summary = '\n'.join(summaries.get(record.id, []))
+
+    def _compute_progress_id(self):
+        """Registro de avance de la importación (escrito desde otra transacción)"""
+        progress_by_import = {
+            progress.import_id.id: progress
+            for progress in self.env['invoice.import.progress'].search([('import_id', 'in', self.ids)])
+        }
+        for record in self:
+            record.progress_id = progress_by_import.get(record.id, False)
+
+    def _compute_profile_attachment_ids(self):
+        """Perfiles adjuntos a la importación (guardados desde otra transacción)"""
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+            ('name', '=like', self._profile_attachment_prefix + '%'),
+        ])
+        for record in self:
+            record.profile_attachment_ids = attachments.filtered(lambda attachment: attachment.res_id == record.id)
+
+    def _start_progress(self, processed_lines=0):
+        """Estado para medir el avance desde este momento (ver ``_report_progress``)"""
+        return {'start': time.monotonic(), 'start_lines': processed_lines, 'last_report': 0.0, 'stage': False}
+
+    def _report_progress(self, progress, stage, processed_lines, total_lines=None, force=False):
+        """Informar el avance, como máximo cada ``_progress_interval`` segundos salvo con ``force``
+        
+        Solo se avisa al usuario al cambiar de etapa o al terminar.
+        """
+        self.ensure_one()
+        now = time.monotonic()
+        if not force and now - progress['last_report'] < self._progress_interval:
+            return
+        progress['last_report'] = now
+        notify = stage != progress['stage'] or stage == 'done'
+        progress['stage'] = stage
+        total_lines = total_lines if total_lines is not None else self.total_lines
+        elapsed = now - progress['start']
+        lines_per_second = (processed_lines - progress['start_lines']) / elapsed if elapsed else 0.0
+        eta = False
+        if lines_per_second and total_lines > processed_lines:
+            eta = fields.Datetime.now() + timedelta(seconds=(total_lines - processed_lines) / lines_per_second)
+        self._write_progress({
+            'stage': stage,
+            'processed_lines': processed_lines,
+            'total_lines': total_lines,
+            'percentage': 100.0 * processed_lines / total_lines if total_lines else 0.0,
+            'lines_per_second': lines_per_second,
+            'eta': eta,
+        }, notify=notify)
+
+    def _write_progress(self, values, notify=True):
+        """Guardar el avance y avisar al usuario en una transacción aparte"""
+        self.ensure_one()
+        partner_id = self.create_uid.partner_id.id
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute("SET LOCAL lock_timeout = %s", [self._progress_lock_timeout])
+                env = self.env(cr=cr, su=True)
+                # Si la importación aún no se confirmó (procesamiento en el wizard) solo se avisa por el bus
+                if env['invoice.import'].browse(self.id).exists():
+                    progress = env['invoice.import.progress'].search([('import_id', '=', self.id)], limit=1)
+                    # Otro proceso (p. ej. otra partición) ya avisó de esta etapa
+                    if progress.stage == values['stage'] and values['stage'] != 'done':
+                        notify = False
+                    if progress:
+                        progress.write(values)
+                    else:
+                        progress.create(dict(values, import_id=self.id))
+                if notify and partner_id:
+                    env['bus.bus']._sendone(env['res.partner'].browse(partner_id), 'simple_notification', {
+                        'type': 'success' if values['stage'] == 'done' else 'info',
+                        'title': self.name,
+                        'message': self._format_progress_message(values),
+                    })
+        except psycopg2.Error as e:
+            _logger.debug("No se pudo guardar el avance de la importación %s: %s", self.id, e)
+
+    def _format_progress_message(self, values):
+        """Texto del aviso de avance"""
+        stages = dict(self.env['invoice.import.progress']._fields['stage']._description_selection(self.env))
+        message = _('%s: %s de %s líneas') % (stages[values['stage']], values['processed_lines'], values['total_lines'] or '?')
+        if values['lines_per_second']:
+            message += _(' (%.0f líneas/s)') % values['lines_per_second']
+        if values['eta']:
+            message += _(', fin estimado %s') % format_datetime(self.env, values['eta'])
+        return message
+
+    def _save_stage_stats(self, timer, partition=-1):
+        """Guardar (y registrar en el log) las mediciones acumuladas en ``timer``"""
+        self.ensure_one()
+        stats_vals = []
+        for stage, values in timer.pop().items():
+            _logger.info("Importación %s, etapa %s: %.3f s, %s consultas, %s filas",
+                         self.id, stage, values['seconds'], values['queries'], values['rows'])
+            stats_vals.append({
+                'import_id': self.id,
+                'partition': partition,
+                'stage': stage,
+                'seconds': values['seconds'],
+                'query_count': values['queries'],
+                'row_count': values['rows'],
+                'call_count': values['calls'],
+            })
+        if stats_vals:
+            self.env['invoice.import.stat'].sudo().create(stats_vals)
+
+    @contextmanager
+    def _profiling(self):
+        """Perfilar con cProfile el bloque de código si la importación lo pide
+        
+        Las estadísticas se adjuntan a la importación en formato pstats
+        (``python -m pstats``, snakeviz, etc.), aunque el bloque falle.
+        """
+        self.ensure_one()
+        if not self.sudo().profile:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            profiler.disable()
+            self._attach_profile(profiler, failed)
+
+    def _attach_profile(self, profiler, failed=False):
+        """Adjuntar a la importación las estadísticas de un perfil de cProfile
+        
+        Si la importación no va a quedar guardada, el perfil se escribe en un archivo temporal (ver el log).
+        """
+        self.ensure_one()
+        profiler.create_stats()
+        vals = {
+            'name': '%s%s_%s.prof' % (self._profile_attachment_prefix, self.id,
+                                      fields.Datetime.now().strftime('%Y%m%d_%H%M%S')),
+            # Mismo formato que cProfile.Profile.dump_stats
+            'raw': marshal.dumps(profiler.stats),
+            'mimetype': 'application/octet-stream',
+            'res_model': self._name,
+            'res_id': self.id,
+        }
+        try:
+            with self.env.registry.cursor() as cr:
+                env = self.env(cr=cr, su=True)
+                if env[self._name].browse(self.id).exists():
+                    attachment = env['ir.attachment'].create(vals)
+                    _logger.info("Importación %s: perfil guardado en el adjunto %s", self.id, attachment.id)
+                    return
+            if not failed:
+                attachment = self.env['ir.attachment'].sudo().create(vals)
+                _logger.info("Importación %s: perfil guardado en el adjunto %s", self.id, attachment.id)
+                return
+            with tempfile.NamedTemporaryFile(prefix=self._profile_attachment_prefix, suffix='.prof', delete=False) as profile_file:
+                profile_file.write(vals['raw'])
+            _logger.warning("Importación %s: el procesamiento falló y la importación no se guardó; perfil en %s",
+                            self.id, profile_file.name)
+        except Exception as e:
+            _logger.warning("No se pudo guardar el perfil de la importación %s: %s", self.id, e)
+
+    def action_view_stats(self):
+        """Ver las mediciones por etapa agrupadas"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Estadísticas por etapa'),
+            'res_model': 'invoice.import.stat',
+            'view_mode': 'list',
+            'domain': [('import_id', '=', self.id)],
+            'context': {'group_by': 'stage'},
+        }
+
+    def _refresh_discount_totals(self):
+        """Calcular los totales de descuento con una sola consulta agregada"""
+        if not self:
+            return
+        self.env['invoice.import.line'].flush_model(['import_id', 'quantity', 'precio', 'descuento_aplicado'])
+        self.env.cr.execute("""
+            SELECT import_id,
+                   SUM(quantity * precio * descuento_aplicado / 100),
+                   AVG(descuento_aplicado)
+              FROM invoice_import_line
+             WHERE import_id IN %s
+               AND descuento_aplicado > 0
+               AND quantity * precio * descuento_aplicado / 100 > 0
+             GROUP BY import_id
+        """, [tuple(self.ids)])
+        totals = {import_id: (amount, percentage) for import_id, amount, percentage in self.env.cr.fetchall()}
+        for record in self:
+            amount, percentage = totals.get(record.id, (0.0, 0.0))
+            record.write({
+                'total_discount_amount': amount,
+                'total_discount_percentage': percentage,
+            })
+
+    def _needs_staging(self):
+        """La importación tiene un archivo adjunto cuyas líneas aún no se cargaron"""
+        self.ensure_one()
+        return bool(self.attachment_id) and not self.total_lines \
+            and not self.env['invoice.import.line'].search_count([('import_id', '=', self.id)], limit=1)
+
+    def _stage_from_attachment(self, timer=None):
+        """Cargar las líneas de la importación leyendo el archivo adjunto
+        
+        El archivo se lee por streaming desde el filestore.
+        """
+        self.ensure_one()
+        timer = timer or StageTimer(self.env)
+        attachment = self.attachment_id.sudo()
+        engine = file_reader.choose_engine(self.file_type, attachment.file_size, self.reader_engine)
+        rows = file_reader.iter_attachment_rows(attachment, self.file_type, engine)
+        self.total_lines = self._stage_lines(rows, engine, timer)
+        self._save_stage_stats(timer)
+
+    def _stage_lines(self, rows, engine='native', timer=None):
+        """Crear las líneas de importación por lotes a medida que se leen las filas
+        
+        Retorna la cantidad de líneas creadas.
+        """
+        self.ensure_one()
+        Line = self.env['invoice.import.line']
+        timer = timer or StageTimer(self.env)
+        # El formato de fecha se infiere una sola vez por archivo
+        date_parser = DateParser(engine=engine)
+        batches = file_reader.batched(rows, self._staging_batch_size)
+        progress = self._start_progress()
+        total_lines = 0
+        while True:
+            with timer.measure('parse') as counter:
+                batch = next(batches, None)
+                counter['rows'] = len(batch or ())
+            if not batch:
+                break
+            with timer.measure('normalize', len(batch)):
+                vals_list = self._prepare_lines_data(batch, total_lines + 1, date_parser, engine)
+            # Inserción directa: la memoria del lote se libera antes de leer el siguiente
+            with timer.measure('stage', len(vals_list)):
+                Line._bulk_insert(self, vals_list)
+            total_lines += len(vals_list)
+            # El total todavía no se conoce mientras se lee el archivo
+            self._report_progress(progress, 'staging', total_lines, total_lines=0)
+        return total_lines
+
+    @api.model
+    def _prepare_lines_data(self, rows, first_line_number, date_parser=None, engine='native'):
+        """Preparar los datos de un lote de filas (ver ``tools.line_normalizer``)
+        
+        Las filas con una fecha o un número que no se pudo interpretar quedan con error.
+        """
+        lines_data, date_errors, number_errors = line_normalizer.normalize_rows(
+            rows, first_line_number, fields.Date.today(), date_parser, engine
+        )
+        messages = {}
+        for position, value in date_errors.items():
+            messages.setdefault(position, []).append(_('Fecha inválida: %s') % value)
+        for position, columns in number_errors.items():
+            messages.setdefault(position, []).extend(
+                _('Número inválido en %s: %s') % (column, value) for column, value in columns.items()
+            )
+        for position, position_messages in messages.items():
+            message = '\n'.join(position_messages)
+            lines_data[position].update({
+                'state': 'error',
+                'error_message': message,
+                'parse_error': message,
+            })
+        return lines_data
+
+    def _prepare_import_context(self):
+        """Construir una sola vez el contexto de la importación (diario, moneda y cachés)"""
+        self.ensure_one()
+        journal = self.journal_id or self.env['account.journal'].search([
+            ('type', '=', 'sale'),
+            ('company_id', '=', self.company_id.id)
+        ], limit=1)
+        
+        if not journal:
+            raise UserError(_('No se encontró un diario de ventas configurado'))
+        
+        return {
+            'company': self.company_id,
+            'journal': journal,
+            'refund_journal': self.refund_journal_id or journal,
+            'currency': journal.currency_id or self.company_id.currency_id,
+            # Caché código de cuenta -> id (ver invoice.import.line._resolve_account_codes)
+            'account_cache': {},
+            # Mediciones por etapa, guardadas en cada punto de control (ver _save_stage_stats)
+            'stats': StageTimer(self.env),
+        }
+
+    def _get_pending_lines(self):
+        """Líneas que todavía deben procesarse"""
+        self.ensure_one()
+        return self.import_line_ids.filtered(lambda l: l.state in ('draft', 'validated'))
+
+    def _skip_duplicate_lines(self, timer=None):
+        """Omitir en un solo paso las líneas pendientes de documentos ya importados"""
+        self.ensure_one()
+        if not self.skip_duplicates:
+            return self.env['invoice.import.line']
+        timer = timer or StageTimer(self.env)
+        pending_lines = self._get_pending_lines()
+        with timer.measure('deduplicate', len(pending_lines)):
+            skipped_lines = pending_lines._skip_existing_documents()
+        if skipped_lines:
+            _logger.info("Importación %s: %s líneas omitidas por documentos ya importados", self.id, len(skipped_lines))
+            self.processed_lines += len(skipped_lines)
+        return skipped_lines
+
+    def _process_chunk(self, lines, import_ctx):
+        """Procesar un bloque de líneas: validar y crear sus facturas
+        
+        Retorna las líneas que quedaron con error.
+        """
+        # Las líneas validadas en un paso previo ya tienen cliente y producto
+        error_lines = lines.filtered(lambda l: l.state == 'draft')._validate_lines(import_ctx)
+        validated_lines = lines.filtered(lambda l: l.state == 'validated')
+        if validated_lines:
+            try:
+                invoices, invoice_error_lines = validated_lines._create_invoices(import_ctx)
+            except Exception as e:
+                validated_lines.write({
+                    'state': 'error',
+                    'error_message': str(e)
+                })
+                invoice_error_lines = validated_lines
+            error_lines |= invoice_error_lines
+        return error_lines
+
+    def _process_pending_lines(self, commit=False, time_budget=None):
+        """Procesar las líneas pendientes por bloques de documentos
+        
+        Con ``commit=True`` se confirma cada bloque y con ``time_budget`` (segundos) se
+        detiene al superarlo. Retorna True si se procesaron todas las líneas pendientes.
+        """
+        self.ensure_one()
+        start = time.monotonic()
+        
+        # Contexto de la importación (diario, moneda, cuentas por defecto, caché de cuentas)
+        import_ctx = self._prepare_import_context()
+        progress = self._start_progress(self.processed_lines)
+        
+        self._report_progress(progress, 'deduplicate', self.processed_lines, force=True)
+        self._skip_duplicate_lines(import_ctx['stats'])
+        if commit:
+            self.env.cr.commit()
+        
+        for chunk in self._get_pending_lines()._split_in_chunks(self.chunk_size or 500):
+            try:
+                self._process_chunk(chunk, import_ctx)
+            except Exception as e:
+                if not commit:
+                    raise
+                # Descartar el bloque y marcar sus líneas con error para no repetirlo indefinidamente
+                _logger.exception("Error procesando un bloque de la importación %s", self.id)
+                self.env.cr.rollback()
+                chunk.write({
+                    'state': 'error',
+                    'error_message': str(e)
+                })
             
-            for line in record.import_line_ids:
-                if line.monto_descuento_aplicado > 0:
-                    total_discount_amount += line.monto_descuento_aplicado
-                    total_discount_percentage += line.descuento_aplicado
-                    lines_with_discount += 1
+            # Registrar el punto de control del bloque
+            self._save_stage_stats(import_ctx['stats'])
+            self._refresh_discount_totals()
+            self.write({
+                'processed_lines': self.processed_lines + len(chunk),
+                'last_processed_line': max(chunk.mapped('line_number')),
+                'checkpoint_date': fields.Datetime.now(),
+            })
+            if commit:
+                self.env.cr.commit()
+                _logger.info("Importación %s: %s de %s líneas procesadas", self.id, self.processed_lines, self.total_lines)
+            self._report_progress(progress, 'processing', self.processed_lines)
             
-            record.total_discount_amount = total_discount_amount
-            record.total_discount_percentage = total_discount_percentage / lines_with_discount if lines_with_discount > 0 else 0.0
+            if time_budget and time.monotonic() - start > time_budget:
+                return False
+        
+        self._finalize_import()
+        if commit:
+            self.env.cr.commit()
+        return True
+
+    def _finalize_import(self):
+        """Calcular los totales de la importación y dejar el estado final"""
+        self.ensure_one()
+        timer = StageTimer(self.env)
+        with timer.measure('summary', self.total_lines):
+            self._write_summary()
+        self._save_stage_stats(timer)
+        self._report_progress(self._start_progress(), 'done', self.total_lines, force=True)
+
+    def _write_summary(self):
+        """Escribir los contadores y el mensaje de resumen de la importación"""
+        Line = self.env['invoice.import.line']
+        counts = dict(Line._read_group([('import_id', '=', self.id)], ['state'], ['__count']))
+        imported_lines = Line.search([('import_id', '=', self.id), ('state', '=', 'imported')])
+        
+        imported_count = counts.get('imported', 0)
+        error_count = counts.get('error', 0)
+        skipped_count = counts.get('skipped', 0)
+        created_invoices = len(imported_lines.invoice_id)
+        
+        created_clients = self.created_partner_count
+        created_products = self.created_product_count
+        
+        self._refresh_discount_totals()
+        
+        # Crear mensaje de resumen
+        if error_count > 0:
+            message = _('Procesamiento completado con advertencias. Facturas: %d, Clientes: %d, Productos: %d, Errores: %d') % (created_invoices, created_clients, created_products, error_count)
+        else:
+            message = _('¡Procesamiento exitoso! Facturas: %d, Clientes: %d, Productos: %d') % (created_invoices, created_clients, created_products)
+        if skipped_count:
+            message += _(', Líneas omitidas (ya importadas): %d') % skipped_count
+        
+        self.write({
+            'state': 'imported' if error_count == 0 else 'error',
+            'imported_lines': imported_count,
+            'error_lines': error_count,
+            'skipped_lines': skipped_count,
+            'import_date': fields.Datetime.now(),
+            'error_message': message,
+        })
+
+    def _prepare_jobs(self):
+        """Validar las líneas pendientes y repartir los documentos en una tarea por partición"""
+        self.ensure_one()
+        # Sin diario de ventas los trabajadores fallarían en cada bloque: fallar antes de crear las tareas
+        import_ctx = self._prepare_import_context()
+        self.job_ids.filtered(lambda j: j.state == 'done').unlink()
+        
+        self._skip_duplicate_lines(import_ctx['stats'])
+        pending_lines = self._get_pending_lines()
+        pending_lines.filtered(lambda l: l.state == 'draft')._validate_lines(import_ctx)
+        self._save_stage_stats(import_ctx['stats'])
+        validated_lines = pending_lines.filtered(lambda l: l.state == 'validated')
+        
+        partitions = [[] for dummy in range(max(self.worker_count, 1))]
+        for index, document_lines in enumerate(validated_lines._group_by_document().values()):
+            partitions[index % len(partitions)].extend(document_lines.ids)
+        
+        jobs_vals = []
+        for partition, line_ids in enumerate(partitions):
+            if not line_ids:
+                continue
+            self.env['invoice.import.line'].browse(line_ids).write({'partition': partition})
+            jobs_vals.append({
+                'import_id': self.id,
+                'partition': partition,
+                'total_lines': len(line_ids),
+            })
+        self.env['invoice.import.job'].create(jobs_vals)
+        if not jobs_vals:
+            self._finalize_import()
+
+    def _finalize_if_done(self):
+        """Cerrar la importación cuando todas sus particiones terminaron
+        
+        La fila de la importación se bloquea para que solo uno de los
+        trabajadores que terminan al mismo tiempo calcule el resumen.
+        """
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT id FROM invoice_import WHERE id = %s AND state = 'processing' FOR UPDATE SKIP LOCKED",
+            [self.id]
+        )
+        if not self.env.cr.fetchone():
+            return
+        self.invalidate_recordset()
+        if self.job_ids.filtered(lambda j: j.state == 'pending'):
+            return
+        self.processed_lines = self.total_lines - len(self._get_pending_lines())
+        self._finalize_import()
+
+    @api.model
+    def _trigger_import_crons(self):
+        """Despertar las tareas programadas de importación (planificador y trabajadores)"""
+        for cron_xmlid in ('ir_cron_process_invoice_imports', 'ir_cron_invoice_import_worker_1',
+                           'ir_cron_invoice_import_worker_2', 'ir_cron_invoice_import_worker_3'):
+            cron = self.env.ref('invoice_import_massive.%s' % cron_xmlid, raise_if_not_found=False)
+            if cron and cron.active:
+                cron._trigger()
+
+    def action_process_in_background(self):
+        """Encolar la importación para procesarla en segundo plano"""
+        for record in self:
+            if record.state not in ('validated', 'error'):
+                raise UserError(_('Solo se pueden procesar importaciones validadas o con error'))
+        self.write({'state': 'processing'})
+        self._trigger_import_crons()
+
+    @api.model
+    def _cron_process_imports(self, time_budget=600):
+        """Procesar en segundo plano las importaciones encoladas"""
+        start = time.monotonic()
+        for record in self.search([('state', '=', 'processing')], order='create_date'):
+            remaining = time_budget - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            record = record.with_company(record.company_id)
+            try:
+                with record._profiling():
+                    # Los archivos encolados desde el wizard se cargan aquí, desde su adjunto
+                    if record._needs_staging():
+                        record._stage_from_attachment()
+                        self.env.cr.commit()
+                    if record.worker_count > 1:
+                        if not record.job_ids.filtered(lambda j: j.state == 'pending'):
+                            record._prepare_jobs()
+                            self._trigger_import_crons()
+                            self.env.cr.commit()
+                        continue
+                    done = record._process_pending_lines(commit=True, time_budget=remaining)
+            except Exception as e:
+                _logger.exception("Error procesando la importación %s en segundo plano", record.id)
+                self.env.cr.rollback()
+                record.write({
+                    'state': 'error',
+                    'error_message': str(e)
+                })
+                self.env.cr.commit()
+                continue
+            if not done:
+                break
+        
+        # Este planificador también actúa como trabajador de las particiones
+        remaining = time_budget - (time.monotonic() - start)
+        if remaining > 0:
+            self.env['invoice.import.job']._cron_run_jobs(time_budget=remaining)
+        if self.search_count([('state', '=', 'processing')], limit=1):
+            self._trigger_import_crons()
+
+    def action_resume(self):
+        """Retomar la importación desde la última línea sin procesar
+        
+        Las líneas ya importadas se conservan; solo se vuelven a procesar las
+        líneas en borrador, validadas o con error, sin volver a leer el archivo.
+        """
+        for record in self:
+            if record.state not in ('validated', 'error'):
+                raise UserError(_('Solo se pueden retomar importaciones validadas o con error'))
+            record._reset_error_lines()
+        self.action_process_in_background()
+
+    def _reset_error_lines(self):
+        """Volver a borrador las líneas con error para procesarlas de nuevo
+        
+        Las líneas con valores que no se pudieron leer del archivo conservan su error.
+        """
+        self.ensure_one()
+        self.import_line_ids.filtered(lambda l: l.state == 'error' and not l.parse_error).write({
+            'state': 'draft',
+            'error_message': False
+        })
+        self.write({
+            'processed_lines': len(self.import_line_ids) - len(self._get_pending_lines()),
+            'error_lines': len(self.import_line_ids.filtered(lambda l: l.state == 'error')),
+            'error_message': False
+        })
+
+    @api.model
+    def _find_by_file_hash(self, file_hash, company):
+        """Buscar la importación más reciente del mismo archivo en la compañía
+        
+        Las importaciones en borrador (reseteadas, sin líneas) no se consideran.
+        """
+        return self.search([
+            ('file_hash', '=', file_hash),
+            ('company_id', '=', company.id),
+            ('state', '!=', 'draft'),
+        ], limit=1)
 
     def action_reset(self):
         """Resetear el import para volver a procesar"""
         self.ensure_one()
+        self.job_ids.sudo().unlink()
+        self.stat_ids.sudo().unlink()
+        self.env['invoice.import.progress'].sudo().search([('import_id', '=', self.id)]).unlink()
         self.write({
             'state': 'draft',
             'import_line_ids': [(5, 0, 0)],
             'total_lines': 0,
+            'processed_lines': 0,
+            'last_processed_line': 0,
+            'checkpoint_date': False,
             'imported_lines': 0,
             'error_lines': 0,
+            'skipped_lines': 0,
+            'total_discount_amount': 0.0,
+            'total_discount_percentage': 0.0,
+            'created_partner_ids': [Command.clear()],
+            'created_product_ids': [Command.clear()],
             'error_message': False
         })
 
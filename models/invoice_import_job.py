@@ -0,0 +1,161 @@
+import logging
+import time
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class InvoiceImportJob(models.Model):
+    _name = 'invoice.import.job'
+    _description = 'Partición de Importación de Facturas'
+    _order = 'import_id, partition'
+
+    import_id = fields.Many2one(
+        'invoice.import',
+        string='Importación',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    
+    partition = fields.Integer(
+        string='Partición',
+        required=True
+    )
+    
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Terminado')
+    ], string='Estado', default='pending', required=True, readonly=True, index=True)
+    
+    total_lines = fields.Integer(
+        string='Total de líneas',
+        readonly=True
+    )
+    
+    processed_lines = fields.Integer(
+        string='Líneas procesadas',
+        readonly=True
+    )
+    
+    last_processed_line = fields.Integer(
+        string='Última línea procesada',
+        readonly=True
+    )
+    
+    checkpoint_date = fields.Datetime(
+        string='Fecha del punto de control',
+        readonly=True
+    )
+    
+    company_id = fields.Many2one('res.company', string='Compañía', related='import_id.company_id', store=True)
+
+    def _get_pending_lines(self):
+        """Líneas de la partición que todavía deben procesarse"""
+        self.ensure_one()
+        return self.env['invoice.import.line'].search([
+            ('import_id', '=', self.import_id.id),
+            ('partition', '=', self.partition),
+            ('state', 'in', ('draft', 'validated')),
+        ])
+
+    @api.model
+    def _claim_job(self):
+        """Tomar una partición pendiente libre, bloqueada hasta el siguiente commit"""
+        self.env.cr.execute("""
+            SELECT id FROM invoice_import_job
+             WHERE state = 'pending'
+             ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _process_next_chunk(self):
+        """Procesar el siguiente bloque de la partición y registrar el punto de control"""
+        self.ensure_one()
+        # Las líneas se leen con la compañía de la importación (cuentas y propiedades por compañía)
+        job = self.with_company(self.import_id.company_id)
+        import_record = job.import_id
+        pending_lines = job._get_pending_lines()
+        if not pending_lines:
+            self.state = 'done'
+            return
+        
+        chunk = pending_lines._split_in_chunks(import_record.chunk_size or 500)[0]
+        import_ctx = {}
+        try:
+            with self.env.cr.savepoint():
+                import_ctx = import_record._prepare_import_context()
+                import_record._process_chunk(chunk, import_ctx)
+        except Exception as e:
+            # Marcar las líneas del bloque con error para no repetirlo indefinidamente
+            _logger.exception("Error procesando la partición %s de la importación %s", self.partition, import_record.id)
+            chunk.write({
+                'state': 'error',
+                'error_message': str(e)
+            })
+        
+        if import_ctx:
+            import_record._save_stage_stats(import_ctx['stats'], partition=self.partition)
+        self.write({
+            'processed_lines': self.processed_lines + len(chunk),
+            'last_processed_line': max(chunk.mapped('line_number')),
+            'checkpoint_date': fields.Datetime.now(),
+            'state': 'done' if len(chunk) == len(pending_lines) else 'pending',
+        })
+
+    def _fail(self, error):
+        """Terminar la partición marcando con error sus líneas pendientes"""
+        self.ensure_one()
+        # Otro trabajador pudo haber tomado la partición después del rollback
+        self.env.cr.execute(
+            "SELECT id FROM invoice_import_job WHERE id = %s AND state = 'pending' FOR UPDATE SKIP LOCKED",
+            [self.id]
+        )
+        if not self.env.cr.fetchone():
+            return
+        self._get_pending_lines().write({
+            'state': 'error',
+            'error_message': str(error)
+        })
+        self.state = 'done'
+
+    @api.model
+    def _cron_run_jobs(self, time_budget=600):
+        """Trabajador: procesar bloques de las particiones pendientes"""
+        start = time.monotonic()
+        progress_by_import = {}
+        while time.monotonic() - start < time_budget:
+            job = self._claim_job()
+            if not job:
+                break
+            try:
+                job._process_next_chunk()
+            except Exception as e:
+                # Un error fuera del bloque no debe bloquear la partición (y las que siguen) para siempre
+                _logger.exception("Error procesando la partición %s de la importación %s", job.partition, job.import_id.id)
+                self.env.cr.rollback()
+                job._fail(e)
+            import_record = job.import_id
+            finished = job.state == 'done'
+            self.env.cr.commit()
+            _logger.info("Importación %s, partición %s: %s de %s líneas procesadas",
+                         import_record.id, job.partition, job.processed_lines, job.total_lines)
+            
+            # Avance de toda la importación (todas las particiones)
+            processed_lines = import_record.total_lines - self.env['invoice.import.line'].search_count([
+                ('import_id', '=', import_record.id),
+                ('state', 'in', ('draft', 'validated')),
+            ])
+            if import_record.id not in progress_by_import:
+                progress_by_import[import_record.id] = import_record._start_progress(processed_lines)
+            import_record._report_progress(progress_by_import[import_record.id], 'processing', processed_lines)
+            if finished:
+                import_record._finalize_if_done()
+                self.env.cr.commit()
+        
+        if self.search_count([('state', '=', 'pending')], limit=1):
+            self.env['invoice.import']._trigger_import_crons()
@@ -1,5 +1,11 @@
-from odoo import models, fields, api, _
+from collections import defaultdict
+
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.osv import expression
+from odoo.tools import split_every
+
+from ..tools.stage_timer import measure
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -10,6 +16,22 @@ class InvoiceImportLine(models.Model):
     _description = 'Línea de Importación de Factura'
     _order = 'line_number'
 
+    # Cantidad de documentos por llamada a account.move.create
+    _create_batch_size = 500
+    # Cantidad de valores por consulta al resolver clientes y productos
+    _resolve_batch_size = 1000
+    # Filas por sentencia INSERT en la carga masiva de staging
+    _bulk_insert_page_size = 1000
+    # Columnas que se cargan directamente desde los valores normalizados del archivo
+    _staging_columns = (
+        'line_number', 'fecha', 'comprobante', 'n_interno', 'n_fiscal', 'cliente_codigo',
+        'nombre_cliente', 'razon_social', 'tipo_identificacion', 'identificacion', 'sucursal',
+        'vendedor', 'codigo_articulo', 'nombre_articulo', 'referencia', 'codigo_barra',
+        'proveedor', 'cuenta', 'cuenta_cxc', 'quantity', 'precio', 'descuento',
+        'descuento_porcentaje', 'impuesto', 'impuesto_2', 'total', 'comentario',
+        'state', 'error_message', 'parse_error',
+    )
+
     import_id = fields.Many2one(
         'invoice.import',
         string='Importación',
@@ -23,7 +45,7 @@ class InvoiceImportLine(models.Model):
     )
     
     # Datos del archivo original
-    fecha = fields.Date(string='Fecha', required=True)
+    fecha = fields.Date(string='Fecha', help='Vacía cuando la fecha del archivo no se pudo interpretar')
     comprobante = fields.Char(string='Comprobante', required=True)
     n_interno = fields.Char(string='Número Interno', required=True)
     n_fiscal = fields.Char(string='Número Fiscal', required=True)
@@ -63,32 +85,82 @@ class InvoiceImportLine(models.Model):
         ('draft', 'Borrador'),
         ('validated', 'Validado'),
         ('imported', 'Importado'),
+        ('skipped', 'Omitido'),
         ('error', 'Error')
     ], string='Estado', default='draft', readonly=True)
     
     invoice_id = fields.Many2one('account.move', string='Factura Creada', readonly=True)
+    partition = fields.Integer(string='Partición', readonly=True, help='Partición asignada para el procesamiento en paralelo')
     error_message = fields.Text(string='Mensaje de error', readonly=True)
+    parse_error = fields.Text(
+        string='Error de lectura',
+        readonly=True,
+        help='Fecha o número del archivo que no se pudo interpretar. Se conserva al retomar la importación'
+    )
     company_id = fields.Many2one('res.company', string='Compañía', related='import_id.company_id', store=True)
 
+    @api.model
+    def _get_subtotal_descuento(self, quantity, precio, descuento, descuento_porcentaje):
+        """Subtotal con descuento a partir de los valores de una línea"""
+        # Los valores ya vienen positivos (convertidos en el wizard si es NCR)
+        subtotal = quantity * precio
+        
+        # Calcular descuento por monto o porcentaje (todos los valores son positivos)
+        descuento_por_monto = 0.0
+        
+        if descuento and descuento > 0.0:
+            # Usar monto del descuento directamente (ya viene positivo)
+            descuento_por_monto = descuento
+        elif descuento_porcentaje and descuento_porcentaje > 0.0:
+            # Calcular monto basado en porcentaje (ya viene positivo)
+            descuento_por_monto = subtotal * (descuento_porcentaje / 100)
+        
+        # Aplicar el descuento (todos los valores son positivos)
+        return subtotal - descuento_por_monto
+
     @api.depends('quantity', 'precio', 'descuento', 'descuento_porcentaje')
     def _compute_subtotal_descuento(self):
         """Calcular el subtotal con descuento"""
         for line in self:
-            # Los valores ya vienen positivos (convertidos en el wizard si es NCR)
-            subtotal = line.quantity * line.precio
-            
-            # Calcular descuento por monto o porcentaje (todos los valores son positivos)
-            descuento_por_monto = 0.0
-            
-            if line.descuento and line.descuento > 0.0:
-                # Usar monto del descuento directamente (ya viene positivo)
-                descuento_por_monto = line.descuento
-            elif line.descuento_porcentaje and line.descuento_porcentaje > 0.0:
-                # Calcular monto basado en porcentaje (ya viene positivo)
-                descuento_por_monto = subtotal * (line.descuento_porcentaje / 100)
-            
-            # Aplicar el descuento (todos los valores son positivos)
-            line.subtotal_descuento = subtotal - descuento_por_monto
+            line.subtotal_descuento = self._get_subtotal_descuento(
+                line.quantity, line.precio, line.descuento, line.descuento_porcentaje
+            )
+
+    @api.model
+    def _bulk_insert(self, import_record, vals_list):
+        """Insertar líneas de staging con un INSERT de varias filas por página, sin ``create``"""
+        if not vals_list:
+            return
+        columns = list(self._staging_columns) + [
+            'import_id', 'company_id', 'subtotal_descuento',
+            'create_uid', 'create_date', 'write_uid', 'write_date',
+        ]
+        now = self.env.cr.now()
+        extra_values = [import_record.id, import_record.company_id.id]
+        audit_values = [self.env.uid, now, self.env.uid, now]
+        
+        for page in split_every(self._bulk_insert_page_size, vals_list, list):
+            params = []
+            for vals in page:
+                params.extend(
+                    None if vals.get(column) is False else vals.get(column)
+                    for column in self._staging_columns
+                )
+                params.extend(extra_values)
+                params.append(self._get_subtotal_descuento(
+                    vals.get('quantity') or 0.0, vals.get('precio') or 0.0,
+                    vals.get('descuento'), vals.get('descuento_porcentaje')
+                ))
+                params.extend(audit_values)
+            row_template = '(%s)' % ', '.join(['%s'] * len(columns))
+            query = 'INSERT INTO invoice_import_line (%s) VALUES %s' % (
+                ', '.join('"%s"' % column for column in columns),
+                ', '.join([row_template] * len(page)),
+            )
+            self.env.cr.execute(query, params)
+        
+        self.invalidate_model()
+        import_record.invalidate_recordset(['import_line_ids'])
     
     @api.depends('quantity', 'precio', 'descuento_aplicado')
     def _compute_monto_descuento_aplicado(self):
@@ -139,234 +211,566 @@ class InvoiceImportLine(models.Model):
             })
             raise
 
+    def _validate_lines(self, import_ctx=None):
+        """Validar en bloque las líneas (crea clientes y productos si no existen)
+        
+        Retorna las líneas que quedaron con error.
+        """
+        error_lines = self.browse()
+        assignments = defaultdict(list)
+        
+        for company in self.company_id:
+            company_lines = self.filtered(lambda l: l.company_id == company)
+            with measure(import_ctx, 'resolve_partners', len(company_lines)):
+                partner_ids, new_partners = self._resolve_partners(company_lines, company)
+            with measure(import_ctx, 'resolve_products', len(company_lines)):
+                product_ids, new_products = self._resolve_products(company_lines, company)
+            if new_partners or new_products:
+                company_lines.import_id.write({
+                    'created_partner_ids': [Command.link(partner_id) for partner_id in new_partners.ids],
+                    'created_product_ids': [Command.link(product_id) for product_id in new_products.ids],
+                })
+            
+            for line, partner_id, product_id in zip(company_lines, partner_ids, product_ids):
+                try:
+                    # Un valor mal leído quedó en 0 o sin fecha: nunca se factura así
+                    if line.parse_error:
+                        raise UserError(line.parse_error)
+                    
+                    if not line.fecha:
+                        raise UserError(_('La línea no tiene una fecha válida'))
+                    
+                    if not partner_id:
+                        raise UserError(_('No se pudo encontrar o crear el cliente: %s') % line.nombre_cliente)
+                    
+                    if not product_id:
+                        raise UserError(_('No se pudo encontrar o crear el producto: %s') % line.nombre_articulo)
+                    
+                    assignments[(partner_id, product_id)].append(line.id)
+                except Exception as e:
+                    line.write({
+                        'state': 'error',
+                        'error_message': str(e)
+                    })
+                    error_lines |= line
+        
+        # Una escritura por combinación cliente/producto en lugar de una por línea
+        for (partner_id, product_id), line_ids in assignments.items():
+            self.browse(line_ids).write({
+                'partner_id': partner_id,
+                'product_id': product_id,
+                'state': 'validated',
+                'error_message': False,
+            })
+        
+        return error_lines
+
     def _find_or_create_partner(self):
         """Buscar o crear el partner"""
-        # Buscar por identificación primero
-        if self.identificacion:
-            partner = self.env['res.partner'].search([
-                ('vat', '=', self.identificacion),
-                ('company_id', '=', self.company_id.id)
-            ], limit=1)
-            if partner:
-                return partner
-        
-        # Buscar por código de cliente
-        if self.cliente_codigo:
-            partner = self.env['res.partner'].search([
-                ('ref', '=', self.cliente_codigo),
-                ('company_id', '=', self.company_id.id)
-            ], limit=1)
-            if partner:
-                return partner
-        
-        # Buscar por nombre
-        partner = self.env['res.partner'].search([
-            ('name', 'ilike', self.nombre_cliente),
-            ('company_id', '=', self.company_id.id)
-        ], limit=1)
-        
-        if partner:
-            return partner
-        
-        # Crear nuevo partner
+        self.ensure_one()
+        partner_ids, dummy = self._resolve_partners(self, self.company_id)
+        return self.env['res.partner'].browse(partner_ids[0])
+
+    @api.model
+    def _prepare_partner_vals(self, row, company):
+        """Preparar los valores para crear un cliente desde una fila"""
         partner_vals = {
-            'name': self.nombre_cliente or self.razon_social,
-            'company_id': self.company_id.id,
+            'name': row['nombre_cliente'] or row['razon_social'],
+            'company_id': company.id,
             'is_company': True,
         }
         
-        if self.identificacion:
-            partner_vals['vat'] = self.identificacion
+        if row['identificacion']:
+            partner_vals['vat'] = row['identificacion']
         
-        if self.cliente_codigo:
-            partner_vals['ref'] = self.cliente_codigo
+        if row['cliente_codigo']:
+            partner_vals['ref'] = row['cliente_codigo']
         
-        return self.env['res.partner'].create(partner_vals)
+        return partner_vals
+
+    @api.model
+    def _resolve_partners(self, rows, company, create=True, pending=None):
+        """Resolver en bloque los clientes; retorna (ids alineados con ``rows``, clientes nuevos)
+        
+        Con ``create=False`` retorna, en lugar de los clientes nuevos, el mapa fila -> índice en ``pending['vals']``.
+        """
+        Partner = self.env['res.partner']
+        company_domain = [('company_id', '=', company.id)]
+        
+        # Buscar por identificación y por código de cliente
+        by_vat, by_ref = {}, {}
+        for field_name, index in (('vat', by_vat), ('ref', by_ref)):
+            source = 'identificacion' if field_name == 'vat' else 'cliente_codigo'
+            values = {row[source] for row in rows if row[source]}
+            for chunk in split_every(self._resolve_batch_size, values, list):
+                for partner in Partner.search_read([(field_name, 'in', chunk)] + company_domain, [field_name]):
+                    index.setdefault(partner[field_name], partner['id'])
+        
+        def match_by_code(row):
+            return (row['identificacion'] and by_vat.get(row['identificacion'])) \
+                or (row['cliente_codigo'] and by_ref.get(row['cliente_codigo']))
+        
+        # Buscar por nombre solo las filas que no se resolvieron por código
+        by_name = {}
+        names = {row['nombre_cliente'] for row in rows if row['nombre_cliente'] and not match_by_code(row)}
+        for chunk in split_every(self._resolve_batch_size, names, list):
+            domain = expression.OR([[('name', '=ilike', name)] for name in chunk])
+            for partner in Partner.search_read(expression.AND([domain, company_domain]), ['name']):
+                by_name.setdefault(partner['name'].lower(), partner['id'])
+        
+        pending_state = pending if pending is not None else {}
+        new_partner_vals = pending_state.setdefault('vals', [])
+        new_by_vat = pending_state.setdefault('vat', {})
+        new_by_ref = pending_state.setdefault('ref', {})
+        new_by_name = pending_state.setdefault('name', {})
+        partner_ids = []
+        new_index = {}
+        for position, row in enumerate(rows):
+            partner_id = match_by_code(row) \
+                or (row['nombre_cliente'] and by_name.get(row['nombre_cliente'].lower()))
+            partner_ids.append(partner_id or False)
+            if partner_id:
+                continue
+            
+            # Reutilizar un cliente nuevo ya pendiente de crear en esta importación
+            pending_index = None
+            for value, index in ((row['identificacion'], new_by_vat),
+                                 (row['cliente_codigo'], new_by_ref),
+                                 (row['nombre_cliente'] and row['nombre_cliente'].lower(), new_by_name)):
+                if value and value in index:
+                    pending_index = index[value]
+                    break
+            if pending_index is None:
+                if not (row['nombre_cliente'] or row['razon_social']):
+                    continue
+                pending_index = len(new_partner_vals)
+                new_partner_vals.append(self._prepare_partner_vals(row, company))
+                if row['identificacion']:
+                    new_by_vat[row['identificacion']] = pending_index
+                if row['cliente_codigo']:
+                    new_by_ref[row['cliente_codigo']] = pending_index
+                if row['nombre_cliente']:
+                    new_by_name[row['nombre_cliente'].lower()] = pending_index
+            new_index[position] = pending_index
+        
+        if not create:
+            return partner_ids, new_index
+        
+        created = self._create_in_batch(Partner, new_partner_vals)
+        for position, pending_index in new_index.items():
+            partner_ids[position] = created[pending_index].id
+        return partner_ids, Partner.browse([partner.id for partner in created if partner])
+
+    @api.model
+    def _create_in_batch(self, Model, vals_list):
+        """Crear los registros con un solo ``create`` y, si falla, uno por uno (los fallidos quedan vacíos)"""
+        if not vals_list:
+            return []
+        try:
+            with self.env.cr.savepoint():
+                return list(Model.create(vals_list))
+        except Exception as e:
+            _logger.warning("Falló la creación en bloque de %s registros de %s, reintentando uno a uno: %s",
+                            len(vals_list), Model._name, e)
+        records = []
+        for vals in vals_list:
+            try:
+                with self.env.cr.savepoint():
+                    records.append(Model.create(vals))
+            except Exception as e:
+                _logger.warning("No se pudo crear %s %s: %s", Model._name, vals.get('name'), e)
+                records.append(Model)
+        return records
 
     def _find_or_create_product(self):
         """Buscar o crear el producto"""
-        # Buscar por código de artículo primero
-        if self.codigo_articulo:
-            product = self.env['product.product'].search([
-                ('default_code', '=', self.codigo_articulo),
-                ('company_id', '=', self.company_id.id)
-            ], limit=1)
-            if product:
-                return product
-        
-        # Buscar por código de barra
-        if self.codigo_barra:
-            product = self.env['product.product'].search([
-                ('barcode', '=', self.codigo_barra),
-                ('company_id', '=', self.company_id.id)
-            ], limit=1)
-            if product:
-                return product
-        
-        # Buscar por nombre exacto
-        product = self.env['product.product'].search([
-            ('name', '=', self.nombre_articulo),
-            ('company_id', '=', self.company_id.id)
-        ], limit=1)
-        
-        if product:
-            return product
-        
-        # Crear nuevo producto
+        self.ensure_one()
+        product_ids, dummy = self._resolve_products(self, self.company_id)
+        return self.env['product.product'].browse(product_ids[0])
+
+    @api.model
+    def _prepare_product_vals(self, row, company):
+        """Preparar los valores para crear un producto desde una fila"""
         product_vals = {
-            'name': self.nombre_articulo,
+            'name': row['nombre_articulo'],
             'type': 'consu',  # En Odoo 18: 'consu' para bienes tangibles
-            'company_id': self.company_id.id,
-            'list_price': self.precio,
+            'company_id': company.id,
+            'list_price': row['precio'],
         }
         
-        if self.codigo_articulo:
-            product_vals['default_code'] = self.codigo_articulo
+        if row['codigo_articulo']:
+            product_vals['default_code'] = row['codigo_articulo']
         
-        if self.codigo_barra:
-            product_vals['barcode'] = self.codigo_barra
+        if row['codigo_barra']:
+            product_vals['barcode'] = row['codigo_barra']
         
-        return self.env['product.product'].create(product_vals)
+        return product_vals
 
-    def action_create_invoice(self):
-        """Crear la factura desde la línea"""
+    @api.model
+    def _resolve_products(self, rows, company, create=True, pending=None):
+        """Resolver en bloque los productos (ver ``_resolve_partners``)"""
+        Product = self.env['product.product']
+        company_domain = [('company_id', '=', company.id)]
+        
+        # Buscar por código de artículo y por código de barra
+        by_code, by_barcode = {}, {}
+        for field_name, source, index in (('default_code', 'codigo_articulo', by_code),
+                                          ('barcode', 'codigo_barra', by_barcode)):
+            values = {row[source] for row in rows if row[source]}
+            for chunk in split_every(self._resolve_batch_size, values, list):
+                for product in Product.search_read([(field_name, 'in', chunk)] + company_domain, [field_name]):
+                    index.setdefault(product[field_name], product['id'])
+        
+        def match_by_code(row):
+            return (row['codigo_articulo'] and by_code.get(row['codigo_articulo'])) \
+                or (row['codigo_barra'] and by_barcode.get(row['codigo_barra']))
+        
+        # Buscar por nombre exacto solo las filas que no se resolvieron por código
+        by_name = {}
+        names = {row['nombre_articulo'] for row in rows if row['nombre_articulo'] and not match_by_code(row)}
+        for chunk in split_every(self._resolve_batch_size, names, list):
+            for product in Product.search_read([('name', 'in', chunk)] + company_domain, ['name']):
+                by_name.setdefault(product['name'], product['id'])
+        
+        pending_state = pending if pending is not None else {}
+        new_product_vals = pending_state.setdefault('vals', [])
+        new_by_code = pending_state.setdefault('code', {})
+        new_by_barcode = pending_state.setdefault('barcode', {})
+        new_by_name = pending_state.setdefault('name', {})
+        product_ids = []
+        new_index = {}
+        for position, row in enumerate(rows):
+            product_id = match_by_code(row) \
+                or (row['nombre_articulo'] and by_name.get(row['nombre_articulo']))
+            product_ids.append(product_id or False)
+            if product_id:
+                continue
+            
+            # Reutilizar un producto nuevo ya pendiente de crear en esta importación
+            pending_index = None
+            for value, index in ((row['codigo_articulo'], new_by_code),
+                                 (row['codigo_barra'], new_by_barcode),
+                                 (row['nombre_articulo'], new_by_name)):
+                if value and value in index:
+                    pending_index = index[value]
+                    break
+            if pending_index is None:
+                if not row['nombre_articulo']:
+                    continue
+                pending_index = len(new_product_vals)
+                new_product_vals.append(self._prepare_product_vals(row, company))
+                if row['codigo_articulo']:
+                    new_by_code[row['codigo_articulo']] = pending_index
+                if row['codigo_barra']:
+                    new_by_barcode[row['codigo_barra']] = pending_index
+                new_by_name[row['nombre_articulo']] = pending_index
+            new_index[position] = pending_index
+        
+        if not create:
+            return product_ids, new_index
+        
+        created = self._create_in_batch(Product, new_product_vals)
+        for position, pending_index in new_index.items():
+            product_ids[position] = created[pending_index].id
+        return product_ids, Product.browse([product.id for product in created if product])
+
+    def _get_move_type(self):
+        """Determinar el tipo de documento según el comprobante"""
         self.ensure_one()
+        return self._get_move_type_from_comprobante(self.comprobante)
+
+    @api.model
+    def _get_move_type_from_comprobante(self, comprobante):
+        """Tipo de documento (out_invoice / out_refund) de un comprobante"""
+        # IMPORTANTE: Los valores ya vienen convertidos a positivos desde el wizard si es NCR
+        move_type = 'out_invoice'  # Factura por defecto
+        
+        # Detectar si es una nota de crédito usando el campo comprobante
+        # Si el comprobante NO es "Factura", entonces es NCR
+        if comprobante:
+            comprobante_lower = comprobante.lower()
+            # Normalizar: quitar tildes para comparar
+            comprobante_normalized = comprobante_lower.replace('é', 'e').replace('É', 'e')
+            # Si NO contiene "factura", entonces es NCR
+            if 'factura' not in comprobante_normalized:
+                move_type = 'out_refund'  # Nota de crédito (código interno para NCR)
+        return move_type
+
+    @api.model
+    def _find_existing_invoices(self, rows, company):
+        """Ids de los documentos ya importados, alineados con ``rows`` (False si no existe)"""
+        cr = self.env.cr
+        self.flush_model(['company_id', 'n_fiscal', 'invoice_id', 'state'])
+        self.env['account.move'].flush_model(['company_id', 'move_type', 'ref', 'state'])
+        
+        by_fiscal = {}
+        n_fiscals = {row['n_fiscal'] for row in rows if row['n_fiscal']}
+        for chunk in split_every(self._resolve_batch_size, n_fiscals, tuple):
+            cr.execute("""
+                SELECT line.n_fiscal, move.move_type, MIN(move.id)
+                  FROM invoice_import_line line
+                  JOIN account_move move ON move.id = line.invoice_id
+                 WHERE line.company_id = %s
+                   AND line.state = 'imported'
+                   AND line.n_fiscal IN %s
+                   AND move.state != 'cancel'
+                 GROUP BY line.n_fiscal, move.move_type
+            """, [company.id, chunk])
+            for n_fiscal, move_type, move_id in cr.fetchall():
+                by_fiscal[(n_fiscal, move_type)] = move_id
+        
+        by_ref = {}
+        refs = {row['n_interno'] for row in rows if row['n_interno']}
+        for chunk in split_every(self._resolve_batch_size, refs, tuple):
+            cr.execute("""
+                SELECT ref, move_type, MIN(id)
+                  FROM account_move
+                 WHERE company_id = %s
+                   AND move_type IN ('out_invoice', 'out_refund')
+                   AND ref IN %s
+                   AND state != 'cancel'
+                 GROUP BY ref, move_type
+            """, [company.id, chunk])
+            for ref, move_type, move_id in cr.fetchall():
+                by_ref[(ref, move_type)] = move_id
+        
+        move_ids = []
+        move_types = {}
+        for row in rows:
+            comprobante = row['comprobante']
+            if comprobante not in move_types:
+                move_types[comprobante] = self._get_move_type_from_comprobante(comprobante)
+            move_type = move_types[comprobante]
+            move_id = (row['n_fiscal'] and by_fiscal.get((row['n_fiscal'], move_type))) \
+                or (row['n_interno'] and by_ref.get((row['n_interno'], move_type)))
+            move_ids.append(move_id or False)
+        return move_ids
+
+    def _skip_existing_documents(self):
+        """Marcar como omitidas las líneas cuyo documento ya fue importado
         
-        try:
-            if self.state != 'validated':
-                self.action_validate_line()
-            
-            if not self.partner_id:
-                raise UserError(_('No se pudo validar el cliente'))
-            
-            if not self.product_id:
-                raise UserError(_('No se pudo validar el producto'))
-            
-            # Obtener el diario de facturas de cliente
-            journal = self.env['account.journal'].search([
-                ('type', '=', 'sale'),
-                ('company_id', '=', self.company_id.id)
-            ], limit=1)
-            
-            if not journal:
-                raise UserError(_('No se encontró un diario de ventas configurado'))
-            
-            # Determinar el tipo de documento
-            # IMPORTANTE: Los valores ya vienen convertidos a positivos desde el wizard si es NCR
-            move_type = 'out_invoice'  # Factura por defecto
-            
-            # Detectar si es una nota de crédito usando el campo comprobante
-            # Si el comprobante NO es "Factura", entonces es NCR
-            if self.comprobante:
-                comprobante_lower = self.comprobante.lower()
-                # Normalizar: quitar tildes para comparar
-                comprobante_normalized = comprobante_lower.replace('é', 'e').replace('É', 'e')
-                # Si NO contiene "factura", entonces es NCR
-                if 'factura' not in comprobante_normalized:
-                    move_type = 'out_refund'  # Nota de crédito (código interno para NCR)
-            
-            # Los valores ya están en positivo (convertidos en el wizard si es NCR)
-            quantity = self.quantity  # Ya viene positivo del wizard
-            price_unit = self.precio  # Ya viene positivo del wizard
-            
-            # Calcular el descuento a aplicar
-            # IMPORTANTE: Todos los valores ya están en positivo (convertidos en el wizard)
-            # El descuento ya viene positivo si es NCR, así que trabajamos igual para facturas y NCR
-            discount_percentage = 0.0
-            subtotal_base = quantity * price_unit
-            
-            # Calcular el porcentaje de descuento
-            if subtotal_base != 0.0:
-                # Si hay monto de descuento, calcular el porcentaje
-                if self.descuento and self.descuento > 0.0:
-                    # Calcular porcentaje basado en el monto del descuento (ya está positivo)
-                    discount_percentage = (self.descuento / subtotal_base) * 100
-                # Si no hay monto pero hay porcentaje, usar el porcentaje directamente
-                elif self.descuento_porcentaje and self.descuento_porcentaje > 0.0:
-                    # El porcentaje ya viene positivo (convertido en el wizard si es NCR)
-                    discount_percentage = self.descuento_porcentaje
-            
-            # IMPORTANTE: Guardar el porcentaje calculado ANTES de crear la factura
-            # Esto permite que los campos computados puedan usar el porcentaje
-            if discount_percentage > 0.0:
-                # Guardar el porcentaje calculado
-                self.descuento_porcentaje = discount_percentage
-                self.descuento_aplicado = discount_percentage
-            
-            # Usar la cuenta contable del Excel (campo cuenta)
-            account_id = None
-            if self.cuenta:
-                # Buscar la cuenta contable por código (Odoo 18: sin filtro company_id)
-                account = self.env['account.account'].search([
-                    ('code', '=', self.cuenta)
-                ], limit=1)
-                # Si no se encuentra, intentar con code_store (formato JSON en Odoo 18)
-                if not account:
-                    account = self.env['account.account'].search([
-                        ('code_store->>1', '=', self.cuenta)
-                    ], limit=1)
-                if account:
-                    account_id = account.id
-                else:
-                    # Si no se encuentra la cuenta, usar la cuenta por defecto del producto
-                    account_id = self.product_id.property_account_income_id.id if self.product_id.property_account_income_id else None
-            elif self.account_id:
-                # Usar la cuenta contable especificada manualmente
-                account_id = self.account_id.id
-            
-            # Preparar datos de la factura
-            invoice_line_vals = {
-                'product_id': self.product_id.id,
-                'quantity': quantity,
-                'price_unit': price_unit,
-                'name': self.nombre_articulo,
-                'discount': discount_percentage,
-            }
+        Las líneas omitidas quedan enlazadas a la factura existente.
+        Retorna las líneas omitidas.
+        """
+        skipped = defaultdict(list)
+        for company in self.company_id:
+            company_lines = self.filtered(lambda l: l.company_id == company)
+            for line, move_id in zip(company_lines, self._find_existing_invoices(company_lines, company)):
+                if move_id:
+                    skipped[move_id].append(line.id)
+        
+        skipped_lines = self.browse([line_id for line_ids in skipped.values() for line_id in line_ids])
+        if skipped_lines:
+            skipped_lines.write({
+                'state': 'skipped',
+                'error_message': _('El documento ya fue importado'),
+            })
+            for move_id, line_ids in skipped.items():
+                self.browse(line_ids).write({'invoice_id': move_id})
+        return skipped_lines
+
+    def _get_document_key(self, with_partner=True):
+        """Clave del documento al que pertenece la línea
+        
+        Sin ``with_partner`` la clave no depende del cliente resuelto, lo que
+        permite agrupar líneas que todavía no fueron validadas.
+        """
+        self.ensure_one()
+        if not with_partner:
+            return (self.comprobante, self.n_interno, self.n_fiscal, self.fecha)
+        return (self.comprobante, self.n_interno, self.n_fiscal, self.partner_id.id, self.fecha)
+
+    def _group_by_document(self, with_partner=True):
+        """Agrupar las líneas por documento (comprobante, n_interno, n_fiscal, cliente, fecha)
+        
+        Retorna un diccionario ordenado clave -> líneas del documento.
+        """
+        documents = {}
+        for line in self:
+            documents.setdefault(line._get_document_key(with_partner), []).append(line.id)
+        return {key: self.browse(line_ids) for key, line_ids in documents.items()}
+
+    def _split_in_chunks(self, chunk_size):
+        """Dividir las líneas en bloques de aproximadamente ``chunk_size`` líneas
+        
+        Un documento nunca queda repartido entre dos bloques.
+        """
+        chunks = []
+        chunk_ids = []
+        for document_lines in self._group_by_document(with_partner=False).values():
+            chunk_ids.extend(document_lines.ids)
+            if len(chunk_ids) >= chunk_size:
+                chunks.append(self.browse(chunk_ids))
+                chunk_ids = []
+        if chunk_ids:
+            chunks.append(self.browse(chunk_ids))
+        return chunks
+
+    def _prepare_invoice_line_vals(self, import_ctx):
+        """Preparar los valores de la línea de factura"""
+        self.ensure_one()
+        
+        # Los valores ya están en positivo (convertidos en el wizard si es NCR)
+        quantity = self.quantity  # Ya viene positivo del wizard
+        price_unit = self.precio  # Ya viene positivo del wizard
+        
+        # Calcular el descuento a aplicar
+        # IMPORTANTE: Todos los valores ya están en positivo (convertidos en el wizard)
+        # El descuento ya viene positivo si es NCR, así que trabajamos igual para facturas y NCR
+        discount_percentage = 0.0
+        subtotal_base = quantity * price_unit
+        
+        # Calcular el porcentaje de descuento
+        if subtotal_base != 0.0:
+            # Si hay monto de descuento, calcular el porcentaje
+            if self.descuento and self.descuento > 0.0:
+                # Calcular porcentaje basado en el monto del descuento (ya está positivo)
+                discount_percentage = (self.descuento / subtotal_base) * 100
+            # Si no hay monto pero hay porcentaje, usar el porcentaje directamente
+            elif self.descuento_porcentaje and self.descuento_porcentaje > 0.0:
+                # El porcentaje ya viene positivo (convertido en el wizard si es NCR)
+                discount_percentage = self.descuento_porcentaje
+        
+        # IMPORTANTE: Guardar el porcentaje calculado ANTES de crear la factura
+        # Esto permite que los campos computados puedan usar el porcentaje
+        if discount_percentage > 0.0:
+            # Guardar el porcentaje calculado
+            self.descuento_porcentaje = discount_percentage
+            self.descuento_aplicado = discount_percentage
+        
+        # Usar la cuenta contable del Excel (campo cuenta)
+        account_id = None
+        if self.cuenta:
+            account_id = self._resolve_account_codes([self.cuenta], import_ctx['account_cache'])[self.cuenta]
+            if not account_id:
+                # Si no se encuentra la cuenta, usar la cuenta por defecto del producto
+                # (sin cuenta, Odoo toma la de la categoría o la del diario)
+                account_id = self.product_id.property_account_income_id.id or None
+        elif self.account_id:
+            # Usar la cuenta contable especificada manualmente
+            account_id = self.account_id.id
+        
+        invoice_line_vals = {
+            'product_id': self.product_id.id,
+            'quantity': quantity,
+            'price_unit': price_unit,
+            'name': self.nombre_articulo,
+            'discount': discount_percentage,
+        }
+        
+        # Agregar cuenta contable si está disponible
+        if account_id:
+            invoice_line_vals['account_id'] = account_id
+        
+        return invoice_line_vals
+
+    @api.model
+    def _resolve_account_codes(self, codes, account_cache=None):
+        """Resolver códigos de cuenta con la caché de la importación (código -> id o False)"""
+        if account_cache is None:
+            account_cache = {}
+        missing = {code for code in codes if code and code not in account_cache}
+        if not missing:
+            return account_cache
+        
+        Account = self.env['account.account']
+        # Buscar la cuenta contable por código (Odoo 18: sin filtro company_id)
+        for chunk in split_every(self._resolve_batch_size, missing, list):
+            for account in Account.search_read([('code', 'in', chunk)], ['code']):
+                account_cache.setdefault(account['code'], account['id'])
+        
+        # Si no se encuentra, intentar con code_store (formato JSON en Odoo 18)
+        missing -= set(account_cache)
+        if missing:
+            Account.flush_model(['code_store'])
+            for chunk in split_every(self._resolve_batch_size, missing, tuple):
+                self.env.cr.execute(
+                    "SELECT id, code_store->>'1' FROM account_account WHERE code_store->>'1' IN %s ORDER BY id",
+                    [chunk]
+                )
+                for account_id, code in self.env.cr.fetchall():
+                    account_cache.setdefault(code, account_id)
+        
+        for code in missing - set(account_cache):
+            account_cache[code] = False
+        return account_cache
+
+    def _prepare_invoice_vals(self, import_ctx):
+        """Preparar los valores de la factura para las líneas de un mismo documento"""
+        first_line = self[0]
+        move_type = first_line._get_move_type()
+        journal = import_ctx['refund_journal'] if move_type == 'out_refund' else import_ctx['journal']
+        return {
+            'move_type': move_type,
+            'partner_id': first_line.partner_id.id,
+            'invoice_date': first_line.fecha,
+            'ref': first_line.n_interno,
+            'journal_id': journal.id,
+            'company_id': import_ctx['company'].id,
+            'currency_id': import_ctx['currency'].id,
+            'invoice_line_ids': [(0, 0, line._prepare_invoice_line_vals(import_ctx)) for line in self],
+        }
+
+    def _check_document_lines(self):
+        """Verificar que las líneas del documento estén listas para facturar"""
+        if self.filtered(lambda l: not l.partner_id):
+            raise UserError(_('No se pudo validar el cliente'))
+        
+        if self.filtered(lambda l: not l.product_id):
+            raise UserError(_('No se pudo validar el producto'))
+
+    def _apply_receivable_account(self, invoice, import_ctx):
+        """Cambiar la cuenta de la línea payment_term por la cuenta CxC del Excel
+        
+        Se aplica una sola vez por documento, tomando la primera línea que la indique.
+        """
+        self._apply_receivable_accounts([self], invoice, import_ctx)
+
+    @api.model
+    def _apply_receivable_accounts(self, documents, moves, import_ctx):
+        """Cambiar la cuenta de las líneas payment_term por la cuenta CxC, un ``write`` por cuenta"""
+        lines_by_account = defaultdict(list)
+        for document_lines, move in zip(documents, moves):
+            cuenta_cxc = next((line.cuenta_cxc for line in document_lines if line.cuenta_cxc), False)
+            if not cuenta_cxc or move.move_type not in ('out_invoice', 'out_refund'):
+                continue
             
-            # Agregar cuenta contable si está disponible
-            if account_id:
-                invoice_line_vals['account_id'] = account_id
+            account_id = self._resolve_account_codes([cuenta_cxc], import_ctx['account_cache'])[cuenta_cxc]
+            if not account_id:
+                _logger.warning("Cuenta CxC del Excel NO encontrada: %s, se mantiene la cuenta del partner", cuenta_cxc)
+                continue
             
-            invoice_vals = {
-                'move_type': move_type,
-                'partner_id': self.partner_id.id,
-                'invoice_date': self.fecha,
-                'ref': self.n_interno,
-                'journal_id': journal.id,
-                'company_id': self.company_id.id,
-                'invoice_line_ids': [(0, 0, invoice_line_vals)]
-            }
+            # Buscar la línea payment_term creada por Odoo
+            payment_term_lines = move.line_ids.filtered(lambda l: l.display_type == 'payment_term')
+            if not payment_term_lines:
+                _logger.warning("No se encontró línea payment_term en la factura %s", move.id)
+                continue
+            lines_by_account[account_id].extend(payment_term_lines.filtered(lambda l: l.account_id.id != account_id).ids)
+        
+        for account_id, line_ids in lines_by_account.items():
+            if not line_ids:
+                continue
+            self.env['account.move.line'].browse(line_ids).write({'account_id': account_id})
+            _logger.info("Cuenta CxC %s asignada a %s líneas payment_term", account_id, len(line_ids))
+
+    def _create_document_invoice(self, import_ctx=None):
+        """Crear una única factura con todas las líneas del documento"""
+        if not self:
+            return self.env['account.move']
+        
+        try:
+            if import_ctx is None:
+                import_ctx = self.import_id._prepare_import_context()
+            self._check_document_lines()
+            invoice_vals = self._prepare_invoice_vals(import_ctx)
             
             # Crear la factura (Odoo crea automáticamente la línea payment_term balanceada)
             invoice = self.env['account.move'].create(invoice_vals)
-            _logger.info("Factura creada: %s (ID: %s)", invoice.name, invoice.id)
+            _logger.info("Factura creada: %s (ID: %s) con %s líneas", invoice.name, invoice.id, len(self))
             
-            # Si hay cuenta CxC del Excel, cambiar la cuenta de la línea payment_term
-            if self.cuenta_cxc and invoice.move_type in ('out_invoice', 'out_refund'):
-                _logger.info("=== Cambiando cuenta CxC a: %s ===", self.cuenta_cxc)
-                
-                # Buscar la cuenta por código (Odoo 18: sin filtro company_id)
-                new_receivable_account = self.env['account.account'].search([
-                    ('code', '=', self.cuenta_cxc)
-                ], limit=1)
-                
-                if new_receivable_account:
-                    # Buscar la línea payment_term creada por Odoo
-                    payment_term_line = invoice.line_ids.filtered(
-                        lambda l: l.display_type == 'payment_term'
-                    )
-                    
-                    if payment_term_line:
-                        # Cambiar la cuenta de la línea payment_term
-                        payment_term_line.write({'account_id': new_receivable_account.id})
-                        _logger.info("Cuenta CxC cambiada exitosamente a: %s (ID: %s)", 
-                                   self.cuenta_cxc, new_receivable_account.id)
-                    else:
-                        _logger.warning("No se encontró línea payment_term en la factura")
-                else:
-                    _logger.warning("Cuenta CxC del Excel NO encontrada: %s, se mantiene la cuenta del partner", self.cuenta_cxc)
+            self._apply_receivable_account(invoice, import_ctx)
             
-            # Actualizar la línea con la factura creada
+            # Actualizar las líneas con la factura creada
             # El porcentaje ya se guardó antes de crear la factura
             self.write({
                 'invoice_id': invoice.id,
@@ -382,6 +786,87 @@ class InvoiceImportLine(models.Model):
             })
             raise
 
+    def _create_invoices(self, import_ctx=None, batch_size=None):
+        """Crear las facturas con un ``create`` por bloque de documentos (uno por documento si falla)
+        
+        Retorna una tupla (facturas creadas, líneas con error).
+        """
+        if import_ctx is None:
+            import_ctx = self.import_id._prepare_import_context()
+        batch_size = batch_size or self._create_batch_size
+        invoices = self.env['account.move']
+        error_lines = self.browse()
+        documents = list(self._group_by_document().values())
+        
+        # Resolver de una vez todos los códigos de cuenta de la importación
+        with measure(import_ctx, 'resolve_accounts', len(self)):
+            self._resolve_account_codes(
+                set(self.mapped('cuenta')) | set(self.mapped('cuenta_cxc')),
+                import_ctx['account_cache']
+            )
+        
+        for start in range(0, len(documents), batch_size):
+            batch = []
+            vals_list = []
+            
+            # Preparar los valores de todas las facturas del bloque
+            for document_lines in documents[start:start + batch_size]:
+                try:
+                    document_lines._check_document_lines()
+                    vals_list.append(document_lines._prepare_invoice_vals(import_ctx))
+                    batch.append(document_lines)
+                except Exception as e:
+                    document_lines.write({
+                        'state': 'error',
+                        'error_message': str(e)
+                    })
+                    error_lines |= document_lines
+            
+            if not vals_list:
+                continue
+            
+            batch_rows = sum(len(document_lines) for document_lines in batch)
+            try:
+                with self.env.cr.savepoint():
+                    with measure(import_ctx, 'create_moves', batch_rows):
+                        moves = self.env['account.move'].create(vals_list)
+                    with measure(import_ctx, 'receivable_accounts', batch_rows):
+                        self._apply_receivable_accounts(batch, moves, import_ctx)
+            except Exception as e:
+                # Reintentar documento por documento para aislar el error
+                _logger.warning("Falló la creación en bloque de %s facturas, reintentando una a una: %s", len(vals_list), e)
+                with measure(import_ctx, 'create_moves', batch_rows):
+                    for document_lines in batch:
+                        try:
+                            with self.env.cr.savepoint():
+                                invoices |= document_lines._create_document_invoice(import_ctx)
+                        except Exception as document_error:
+                            document_lines.write({
+                                'state': 'error',
+                                'error_message': str(document_error)
+                            })
+                            error_lines |= document_lines
+                continue
+            
+            _logger.info("Bloque de %s facturas creado", len(moves))
+            invoices |= moves
+            
+            # Enlazar las facturas con sus líneas y marcar el bloque como importado
+            for document_lines, move in zip(batch, moves):
+                document_lines.write({'invoice_id': move.id})
+            self.browse([line.id for document_lines in batch for line in document_lines]).write({'state': 'imported'})
+        
+        return invoices, error_lines
+
+    def action_create_invoice(self):
+        """Crear la factura desde la línea"""
+        self.ensure_one()
+        
+        if self.state != 'validated':
+            self.action_validate_line()
+        
+        return self._create_document_invoice()
+
     def action_view_invoice(self):
         """Ver la factura creada"""
         self.ensure_one()
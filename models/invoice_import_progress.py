@@ -0,0 +1,50 @@
+from odoo import models, fields
+
+
+class InvoiceImportProgress(models.Model):
+    _name = 'invoice.import.progress'
+    _description = 'Avance de Importación de Facturas'
+
+    # El avance se escribe desde una transacción aparte (ver
+    # invoice.import._write_progress) para que sea visible mientras la
+    # transacción principal sigue en curso, sin bloquear la fila de la
+    # importación.
+
+    import_id = fields.Many2one(
+        'invoice.import',
+        string='Importación',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    
+    stage = fields.Selection([
+        ('staging', 'Cargando líneas'),
+        ('deduplicate', 'Buscando documentos ya importados'),
+        ('processing', 'Creando facturas'),
+        ('done', 'Terminado')
+    ], string='Etapa actual')
+    
+    processed_lines = fields.Integer(
+        string='Líneas procesadas'
+    )
+    
+    total_lines = fields.Integer(
+        string='Total de líneas'
+    )
+    
+    percentage = fields.Float(
+        string='Avance (%)'
+    )
+    
+    lines_per_second = fields.Float(
+        string='Líneas por segundo'
+    )
+    
+    eta = fields.Datetime(
+        string='Fin estimado'
+    )
+
+    _sql_constraints = [
+        ('import_uniq', 'unique(import_id)', 'Una importación solo puede tener un registro de avance'),
+    ]
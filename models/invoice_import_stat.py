@@ -0,0 +1,65 @@
+from odoo import models, fields, api
+
+STAGES = [
+    ('decode', 'Lectura del adjunto'),
+    ('parse', 'Lectura de filas'),
+    ('normalize', 'Normalización'),
+    ('stage', 'Carga de líneas'),
+    ('deduplicate', 'Documentos ya importados'),
+    ('resolve_partners', 'Resolución de clientes'),
+    ('resolve_products', 'Resolución de productos'),
+    ('resolve_accounts', 'Resolución de cuentas'),
+    ('create_moves', 'Creación de facturas'),
+    ('receivable_accounts', 'Cuentas CxC'),
+    ('summary', 'Resumen'),
+]
+
+
+class InvoiceImportStat(models.Model):
+    _name = 'invoice.import.stat'
+    _description = 'Estadística de Etapa de Importación'
+    _order = 'import_id, id'
+
+    import_id = fields.Many2one(
+        'invoice.import',
+        string='Importación',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    
+    partition = fields.Integer(
+        string='Partición',
+        help='Partición del trabajador que registró la medición (-1: proceso principal)'
+    )
+    
+    stage = fields.Selection(STAGES, string='Etapa', required=True)
+    
+    seconds = fields.Float(
+        string='Segundos',
+        digits=(16, 3)
+    )
+    
+    query_count = fields.Integer(
+        string='Consultas SQL'
+    )
+    
+    row_count = fields.Integer(
+        string='Filas'
+    )
+    
+    call_count = fields.Integer(
+        string='Ejecuciones'
+    )
+    
+    rows_per_second = fields.Float(
+        string='Filas/segundo',
+        compute='_compute_rows_per_second',
+        digits=(16, 1)
+    )
+
+    @api.depends('seconds', 'row_count')
+    def _compute_rows_per_second(self):
+        """Filas procesadas por segundo"""
+        for stat in self:
+            stat.rows_per_second = stat.row_count / stat.seconds if stat.seconds else 0.0
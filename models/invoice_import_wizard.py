@@ -1,17 +1,28 @@
 import base64
-import io
-import pandas as pd
+import logging
+from contextlib import nullcontext
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 
+from ..tools import file_reader
+from ..tools.date_parser import DateParser
+from ..tools.stage_timer import StageTimer
+
+_logger = logging.getLogger(__name__)
+
 
 class InvoiceImportWizard(models.TransientModel):
     _name = 'invoice.import.wizard'
     _description = 'Wizard para Importación Masiva de Facturas'
 
+    # Cantidad de filas leídas por lote en la validación
+    _staging_batch_size = 1000
+
     file_data = fields.Binary(
         string='Archivo Excel/CSV',
         required=True,
+        attachment=True,
         help='Seleccione un archivo Excel (.xlsx) o CSV (.csv)'
     )
     
@@ -31,6 +42,62 @@ class InvoiceImportWizard(models.TransientModel):
         default=lambda self: self.env.company,
         required=True
     )
+    
+    run_in_background = fields.Boolean(
+        string='Procesar en segundo plano',
+        help='Procesar las líneas en segundo plano por bloques, confirmando cada bloque. Recomendado para archivos grandes'
+    )
+    
+    chunk_size = fields.Integer(
+        string='Tamaño de bloque',
+        default=500,
+        help='Cantidad aproximada de líneas procesadas por bloque'
+    )
+    
+    worker_count = fields.Integer(
+        string='Particiones',
+        default=1,
+        help='Cantidad de trabajadores que procesan la importación en paralelo (solo en segundo plano)'
+    )
+    
+    journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario de ventas',
+        domain="[('type', '=', 'sale'), ('company_id', '=', company_id)]",
+        help='Diario para las facturas. Si se deja vacío se usa el primer diario de ventas de la compañía'
+    )
+    
+    refund_journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario de notas de crédito',
+        domain="[('type', '=', 'sale'), ('company_id', '=', company_id)]",
+        help='Diario para las notas de crédito. Si se deja vacío se usa el diario de ventas'
+    )
+
+    reader_engine = fields.Selection([
+        ('auto', 'Automático'),
+        ('native', 'Nativo (csv / openpyxl)'),
+        ('pandas', 'pandas')
+    ], string='Motor de lectura', default='auto', required=True,
+        help='Automático: lector nativo, salvo los CSV grandes que se leen con pandas si está instalado'
+    )
+    
+    skip_duplicates = fields.Boolean(
+        string='Omitir documentos ya importados',
+        default=True,
+        help='No crear los documentos cuyo número fiscal o referencia ya existe en la compañía'
+    )
+    
+    profile = fields.Boolean(
+        string='Perfilar esta importación',
+        groups='account.group_account_manager',
+        help='Ejecutar el procesamiento con cProfile y adjuntar las estadísticas (archivo .prof) a la importación'
+    )
+    
+    validation_report = fields.Text(
+        string='Resultado de la validación',
+        readonly=True
+    )
 
     @api.onchange('file_data')
     def _onchange_file_data(self):
@@ -125,7 +192,7 @@ class InvoiceImportWizard(models.TransientModel):
         """Procesar el archivo y crear las facturas automáticamente"""
         self.ensure_one()
         
-        if not self.file_data:
+        if not self.with_context(bin_size=True).file_data:
             raise UserError(_('Debe seleccionar un archivo para procesar'))
         
         # Si no hay nombre de archivo, generar uno por defecto
@@ -149,229 +216,253 @@ class InvoiceImportWizard(models.TransientModel):
                 self.file_type = 'excel'  # Por defecto Excel
         
         try:
-            # Decodificar el archivo
-            file_content = base64.b64decode(self.file_data)
-            
-            # Leer el archivo según el tipo
-            if self.file_type == 'excel':
-                df = pd.read_excel(io.BytesIO(file_content), na_values=['', 'nan', 'NaN', 'null', 'NULL'])
-            else:  # csv
-                df = pd.read_csv(io.StringIO(file_content.decode('utf-8')), na_values=['', 'nan', 'NaN', 'null', 'NULL'])
+            # El archivo se lee desde su adjunto en el filestore, sin decodificar el base64
+            attachment = self._get_file_attachment()
+            timer = StageTimer(self.env)
+            with timer.measure('decode'):
+                with file_reader.open_attachment(attachment) as fileobj:
+                    file_hash = file_reader.file_digest(fileobj)
             
-            # Limpiar el DataFrame de valores NaN
-            df = df.fillna('')
+            # Evitar que el mismo archivo se procese dos veces al mismo tiempo (doble envío);
+            # el bloqueo se libera al terminar la transacción
+            self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s)", [int(file_hash[:15], 16)])
+            if not self.env.cr.fetchone()[0]:
+                raise UserError(_('Este archivo ya se está importando, espere a que termine'))
             
-            # Limpiar nombres de columnas (quitar espacios y caracteres especiales)
-            df.columns = df.columns.str.strip().str.replace('\xa0', '', regex=False)
+            # Si el mismo archivo ya se cargó, reutilizar su importación sin volver a leerlo
+            import_record = self.env['invoice.import']._find_by_file_hash(file_hash, self.company_id)
+            if import_record:
+                return self._reuse_import(import_record)
             
             # Crear registro de importación
             import_record = self.env['invoice.import'].create({
                 'name': _('Importación %s') % fields.Date.today(),
                 'file_name': self.file_name,
                 'file_type': self.file_type,
+                'file_hash': file_hash,
                 'company_id': self.company_id.id,
-                'state': 'draft'
+                'state': 'draft',
+                **self._prepare_import_options(),
             })
             
-            # Procesar cada línea del archivo
-            lines_to_create = []
-            for index, row in df.iterrows():
-                line_data = self._prepare_line_data(row, index + 1)
-                lines_to_create.append((0, 0, line_data))
-            
-            # Crear las líneas
-            import_record.write({
-                'import_line_ids': lines_to_create,
-                'total_lines': len(df),
-                'state': 'validated'
+            # El adjunto pasa a la importación (sin copiar su contenido)
+            attachment.write({
+                'name': self.file_name,
+                'res_model': import_record._name,
+                'res_id': import_record.id,
+                'res_field': False,
             })
+            import_record.attachment_id = attachment
             
-            # Procesar automáticamente todas las líneas
-            return self._process_all_lines(import_record)
+            # En segundo plano se perfila el procesamiento en la tarea programada
+            with import_record._profiling() if not self.run_in_background else nullcontext():
+                # En segundo plano las líneas se cargan desde el adjunto en la tarea programada
+                if self.run_in_background:
+                    import_record._save_stage_stats(timer)
+                else:
+                    import_record._stage_from_attachment(timer)
+                import_record.write({'state': 'validated'})
+                
+                # Procesar automáticamente todas las líneas
+                return self._process_all_lines(import_record)
             
         except Exception as e:
             raise UserError(_('Error al procesar el archivo: %s') % str(e))
 
-    def _prepare_line_data(self, row, line_number):
-        """Preparar datos de la línea para crear el registro"""
-        import pandas as pd
-        from datetime import datetime
-        
-        # Función para limpiar valores NaN
-        def clean_value(value, default=''):
-            if pd.isna(value) or value == 'nan' or value == 'NaN':
-                return default
-            return value
-        
-        # Función para limpiar fechas
-        def clean_date(value):
-            if pd.isna(value) or value == 'nan' or value == 'NaN' or value == '':
-                return fields.Date.today()  # Fecha por defecto
-            try:
-                if isinstance(value, str):
-                    # Intentar parsear diferentes formatos de fecha
-                    for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S']:
-                        try:
-                            return datetime.strptime(value, fmt).date()
-                        except:
-                            continue
-                return value
-            except:
-                return fields.Date.today()
+    def _get_file_attachment(self):
+        """Adjunto del filestore donde se guardó el archivo cargado en el wizard"""
+        self.ensure_one()
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'file_data'),
+        ], limit=1)
+        if not attachment:
+            raise UserError(_('Debe seleccionar un archivo para procesar'))
+        return attachment
+
+    def _iter_file_rows(self, engine='native'):
+        """Iterar las filas del archivo cargado leyéndolo desde el filestore"""
+        return file_reader.iter_attachment_rows(self._get_file_attachment(), self.file_type, engine)
+
+    def _get_reader_engine(self):
+        """Motor de lectura para el archivo cargado (según su tamaño en modo automático)"""
+        return file_reader.choose_engine(self.file_type, self._get_file_attachment().file_size, self.reader_engine)
+
+    def action_validate_file(self):
+        """Validar el archivo sin crear clientes, productos ni facturas"""
+        self.ensure_one()
         
-        # Función para limpiar números
-        def clean_float(value, default=0.0):
-            if pd.isna(value) or value == 'nan' or value == 'NaN' or value == '':
-                return default
-            try:
-                return float(value)
-            except:
-                return default
+        # bin_size: comprobar que hay archivo sin cargar su contenido
+        if not self.with_context(bin_size=True).file_data:
+            raise UserError(_('Debe seleccionar un archivo para procesar'))
         
-        # Función para limpiar cantidades (mantener negativas para notas de crédito)
-        def clean_quantity(value, default=1.0):
-            if pd.isna(value) or value == 'nan' or value == 'NaN' or value == '':
-                return default
-            try:
-                qty = float(value)
-                # Si la cantidad es 0, usar 1.0 por defecto
-                if qty == 0:
-                    return default
-                # Mantener cantidades negativas para notas de crédito
-                return qty
-            except:
-                return default
+        try:
+            engine = self._get_reader_engine()
+            result = self._validate_rows(self._iter_file_rows(engine), engine)
+        except Exception as e:
+            raise UserError(_('Error al procesar el archivo: %s') % str(e))
         
-        # Leer valores del Excel
-        comprobante = str(clean_value(row.get('comprobante', '')))
-        quantity_raw = clean_quantity(row.get('cantidad', 1.0), 1.0)
-        precio_raw = clean_float(row.get('precio', 0.0))
-        descuento_raw = clean_float(row.get('descuento', 0.0))
-        descuento_porcentaje_raw = clean_float(row.get('descuento_porcentaje', 0.0))
-        total_raw = clean_float(row.get('total', 0.0))
+        self.validation_report = self._format_validation_report(result)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _validate_rows(self, rows, engine='native'):
+        """Validar las filas por lotes sin escribir en la base de datos; retorna el resumen del informe"""
+        Import = self.env['invoice.import']
+        Line = self.env['invoice.import.line']
+        company = self.company_id
+        date_parser = DateParser(engine=engine)
+        result = {
+            'total_lines': 0,
+            'skipped_lines': 0,
+            'errors': [],
+            'journal_error': False,
+            'missing_accounts': set(),
+            'missing_receivable_accounts': set(),
+        }
         
-        # Detectar si es NCR (Nota de Crédito) usando el campo comprobante
-        # Si el comprobante NO es "Factura", entonces es NCR
-        is_ncr = False
-        if comprobante:
-            comprobante_lower = comprobante.lower()
-            # Normalizar: quitar tildes para comparar
-            comprobante_normalized = comprobante_lower.replace('é', 'e').replace('É', 'e')
-            # Si NO contiene "factura", entonces es NCR
-            if 'factura' not in comprobante_normalized:
-                is_ncr = True
+        # Diario de ventas: misma resolución que la importación real
+        try:
+            Import.new({
+                'company_id': company.id,
+                'journal_id': self.journal_id.id,
+                'refund_journal_id': self.refund_journal_id.id,
+            })._prepare_import_context()
+        except UserError as e:
+            result['journal_error'] = str(e)
         
-        # Si es NCR, convertir todos los valores a positivos (Odoo maneja NCR con valores positivos)
-        # El indicador interno será move_type = 'out_refund'
-        if is_ncr:
-            quantity = abs(quantity_raw)
-            precio = abs(precio_raw)
-            descuento = abs(descuento_raw)
-            descuento_porcentaje = abs(descuento_porcentaje_raw) if descuento_porcentaje_raw else 0.0
-            total = abs(total_raw)
-        else:
-            quantity = quantity_raw
-            precio = precio_raw
-            descuento = descuento_raw
-            descuento_porcentaje = descuento_porcentaje_raw
-            total = total_raw
+        documents = set()
+        skipped_documents = set()
+        # Clientes y productos pendientes de crear, agrupados entre lotes por el propio resolutor
+        new_partners = {}
+        new_products = {}
+        account_codes = set()
+        receivable_codes = set()
+        for batch in file_reader.batched(rows, self._staging_batch_size):
+            lines_data = Import._prepare_lines_data(batch, result['total_lines'] + 1, date_parser, engine)
+            result['total_lines'] += len(lines_data)
+            if self.skip_duplicates:
+                existing_ids = Line._find_existing_invoices(lines_data, company)
+            else:
+                existing_ids = [False] * len(lines_data)
+            
+            # Igual que la importación real, solo se resuelven las líneas que se van a procesar
+            valid_lines = []
+            for line, existing_id in zip(lines_data, existing_ids):
+                if line['state'] == 'error':
+                    result['errors'].append((line['line_number'], line['error_message']))
+                elif existing_id:
+                    result['skipped_lines'] += 1
+                    skipped_documents.add(existing_id)
+                else:
+                    valid_lines.append(line)
+            partner_ids, new_partner_index = Line._resolve_partners(valid_lines, company, create=False, pending=new_partners)
+            product_ids, new_product_index = Line._resolve_products(valid_lines, company, create=False, pending=new_products)
+            
+            for position, line in enumerate(valid_lines):
+                partner_id = partner_ids[position] \
+                    or (position in new_partner_index and ('new', new_partner_index[position]))
+                product_id = product_ids[position] \
+                    or (position in new_product_index and ('new', new_product_index[position]))
+                if not partner_id:
+                    result['errors'].append((line['line_number'], _('No se pudo encontrar o crear el cliente: %s') % line['nombre_cliente']))
+                    continue
+                if not product_id:
+                    result['errors'].append((line['line_number'], _('No se pudo encontrar o crear el producto: %s') % line['nombre_articulo']))
+                    continue
+                
+                documents.add((line['comprobante'], line['n_interno'], line['n_fiscal'], partner_id, line['fecha']))
+                account_codes.add(line['cuenta'])
+                receivable_codes.add(line['cuenta_cxc'])
         
+        account_cache = Line._resolve_account_codes(account_codes | receivable_codes)
+        result.update({
+            'documents': len(documents),
+            'skipped_documents': len(skipped_documents),
+            'new_partners': len(new_partners.get('vals', [])),
+            'new_products': len(new_products.get('vals', [])),
+            'missing_accounts': {code for code in account_codes if code and not account_cache[code]},
+            'missing_receivable_accounts': {code for code in receivable_codes if code and not account_cache[code]},
+        })
+        return result
+
+    def _format_validation_report(self, result, max_errors=200):
+        """Texto del resultado de la validación"""
+        report = [
+            _('Líneas leídas: %s') % result['total_lines'],
+            _('Líneas con error: %s') % len(result['errors']),
+            _('Documentos a crear: %s') % result['documents'],
+            _('Documentos ya importados (se omitirán): %s (%s líneas)') % (result['skipped_documents'], result['skipped_lines']),
+            _('Clientes nuevos: %s') % result['new_partners'],
+            _('Productos nuevos: %s') % result['new_products'],
+        ]
+        if result['journal_error']:
+            report.append(_('Diario: %s') % result['journal_error'])
+        if result['missing_accounts']:
+            report.append(_('Cuentas no encontradas (se usa la cuenta del producto o del diario): %s')
+                          % ', '.join(sorted(result['missing_accounts'])))
+        if result['missing_receivable_accounts']:
+            report.append(_('Cuentas CxC no encontradas (se mantiene la cuenta del cliente): %s')
+                          % ', '.join(sorted(result['missing_receivable_accounts'])))
+        if result['errors']:
+            report.append('')
+            for line_number, message in result['errors'][:max_errors]:
+                report.append(_('Línea %s: %s') % (line_number, message))
+            if len(result['errors']) > max_errors:
+                report.append(_('... y %s errores más') % (len(result['errors']) - max_errors))
+        return '\n'.join(report)
+
+    def _prepare_import_options(self):
+        """Opciones del asistente que se guardan en la importación"""
+        self.ensure_one()
         return {
-            'line_number': line_number,
-            'fecha': clean_date(row.get('fecha', '')),
-            'comprobante': comprobante,
-            'n_interno': str(clean_value(row.get('n_interno', ''))),
-            'n_fiscal': str(clean_value(row.get('n_fiscal', ''))),
-            'cliente_codigo': str(clean_value(row.get('cliente_codigo', ''))),
-            'nombre_cliente': str(clean_value(row.get('nombre_cliente', ''))),
-            'razon_social': str(clean_value(row.get('razon_social', ''))),
-            'tipo_identificacion': str(clean_value(row.get('tipo_identificacion', ''))),
-            'identificacion': str(clean_value(row.get('identificacion', ''))),
-            'sucursal': str(clean_value(row.get('sucursal', ''))),
-            'vendedor': str(clean_value(row.get('vendedor', ''))),
-            'codigo_articulo': str(clean_value(row.get('codigo_articulo', ''))),
-            'nombre_articulo': str(clean_value(row.get('nombre_articulo', ''))),
-            'referencia': str(clean_value(row.get('referencia', ''))),
-            'codigo_barra': str(clean_value(row.get('codigo_barra', ''))),
-            'proveedor': str(clean_value(row.get('proveedor', ''))),
-            'cuenta': str(clean_value(row.get('cuenta', ''))),
-            'cuenta_cxc': str(clean_value(row.get('cuenta_cxc', ''))),
-            'quantity': quantity,  # Ya convertido a positivo si es NCR
-            'precio': precio,  # Ya convertido a positivo si es NCR
-            'descuento': descuento,  # Ya convertido a positivo si es NCR
-            'descuento_porcentaje': descuento_porcentaje,  # Ya convertido a positivo si es NCR
-            'subtotal_descuento': clean_float(row.get('subtotal_descuento', 0.0)),
-            'impuesto': clean_float(row.get('impuesto', 0.0)),
-            'impuesto_2': clean_float(row.get('impuesto_2', 0.0)),
-            'total': total,  # Ya convertido a positivo si es NCR
-            'comentario': str(clean_value(row.get('comentario', ''))),
-            'state': 'draft'
+            'journal_id': self.journal_id.id,
+            'refund_journal_id': self.refund_journal_id.id,
+            'chunk_size': self.chunk_size,
+            'worker_count': self.worker_count if self.run_in_background else 1,
+            'skip_duplicates': self.skip_duplicates,
+            'reader_engine': self.reader_engine,
+            'profile': self.sudo().profile,
         }
 
+    def _reuse_import(self, import_record):
+        """Continuar la importación existente de un archivo ya cargado
+        
+        Si quedó validada o con error se retoma con las opciones actuales del asistente.
+        """
+        _logger.info("Archivo ya cargado en la importación %s, se reutilizan sus líneas", import_record.id)
+        if import_record.state in ('validated', 'error'):
+            import_record.write(self._prepare_import_options())
+            import_record._reset_error_lines()
+            # Si la carga en segundo plano falló, la importación todavía no tiene líneas
+            if not self.run_in_background and import_record._needs_staging():
+                import_record._stage_from_attachment()
+            return self._process_all_lines(import_record)
+        return self._show_final_summary(import_record)
+
     def _process_all_lines(self, import_record):
         """Procesar todas las líneas automáticamente"""
-        imported_count = 0
-        error_count = 0
-        created_clients = 0
-        created_products = 0
-        created_invoices = 0
-        
-        # Procesar cada línea
-        for line in import_record.import_line_ids:
-            try:
-                # Validar la línea (crea cliente y producto si no existen)
-                line.action_validate_line()
-                
-                # Contar clientes y productos creados
-                if line.partner_id:
-                    # Verificar si el cliente fue creado recientemente
-                    if line.partner_id.create_date > import_record.create_date:
-                        created_clients += 1
-                
-                if line.product_id:
-                    # Verificar si el producto fue creado recientemente
-                    if line.product_id.create_date > import_record.create_date:
-                        created_products += 1
-                
-                # Crear la factura
-                invoice = line.action_create_invoice()
-                if line.state == 'imported':
-                    imported_count += 1
-                    created_invoices += 1
-                else:
-                    error_count += 1
-                    
-            except Exception as e:
-                line.write({
-                    'state': 'error',
-                    'error_message': str(e)
-                })
-                error_count += 1
-        
-        # Actualizar estado del import
-        final_state = 'imported' if error_count == 0 else 'error'
-        import_record.write({
-            'state': final_state,
-            'imported_lines': imported_count,
-            'error_lines': error_count,
-            'import_date': fields.Datetime.now()
-        })
+        if self.run_in_background:
+            import_record.action_process_in_background()
+        else:
+            import_record.write({'state': 'processing'})
+            import_record._process_pending_lines()
         
         # Mostrar resumen y abrir la vista de importación
-        return self._show_final_summary(import_record, imported_count, error_count, created_clients, created_products, created_invoices)
+        return self._show_final_summary(import_record)
 
-    def _show_final_summary(self, import_record, imported_count, error_count, created_clients, created_products, created_invoices):
+    def _show_final_summary(self, import_record):
         """Mostrar resumen final y abrir la vista de importación"""
-        # Crear mensaje de resumen
-        if error_count > 0:
-            message = _('Procesamiento completado con advertencias. Facturas: %d, Clientes: %d, Productos: %d, Errores: %d') % (created_invoices, created_clients, created_products, error_count)
+        if import_record.state == 'processing':
+            message = _('La importación se está procesando en segundo plano')
         else:
-            message = _('¡Procesamiento exitoso! Facturas: %d, Clientes: %d, Productos: %d') % (created_invoices, created_clients, created_products)
-        
-        # Actualizar el mensaje en el registro de importación
-        import_record.write({
-            'error_message': message
-        })
+            message = import_record.error_message
         
         # Abrir la vista de importación creada
         return {
@@ -382,5 +473,3 @@ class InvoiceImportWizard(models.TransientModel):
             'view_mode': 'form',
             'target': 'current',
         }
-
-
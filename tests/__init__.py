@@ -0,0 +1,3 @@
+from . import test_import_benchmark
+from . import test_invoice_import
+from . import test_invoice_import_pipeline
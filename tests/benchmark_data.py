@@ -0,0 +1,108 @@
+"""Generador de archivos sintéticos con el formato de exportación del ERP.
+
+Los archivos tienen las mismas columnas que espera el wizard de importación
+y se generan de forma determinista (misma semilla, mismo archivo), para que
+los resultados de distintas versiones del módulo sean comparables.
+"""
+import csv
+import io
+import random
+from datetime import date, timedelta
+
+COLUMNS = [
+    'fecha', 'comprobante', 'n_interno', 'n_fiscal', 'cliente_codigo', 'nombre_cliente',
+    'razon_social', 'tipo_identificacion', 'identificacion', 'sucursal', 'vendedor',
+    'codigo_articulo', 'nombre_articulo', 'referencia', 'codigo_barra', 'proveedor',
+    'cantidad', 'precio', 'descuento', 'descuento_porcentaje', 'subtotal_descuento',
+    'impuesto', 'impuesto_2', 'total', 'cuenta', 'cuenta_cxc', 'comentario',
+]
+
+
+def generate_rows(rows=1000, documents=None, customers=100, products=200, ncr_ratio=0.1,
+                  prefix='BM', seed=42):
+    """Generar las filas de una exportación sintética
+    
+    Las líneas de un mismo documento son consecutivas. Cada documento tiene
+    un cliente y es una nota de crédito con probabilidad ``ncr_ratio`` (con
+    importes negativos, como los envía el ERP). ``prefix`` distingue los
+    números de documento, clientes y productos de cada archivo.
+    """
+    documents = max(min(documents or rows // 5, rows), 1)
+    base_date = date(2024, 1, 1)
+    rng = random.Random(seed)
+    document_info = {}
+    for index in range(rows):
+        document = index * documents // rows
+        if document not in document_info:
+            document_info[document] = (
+                rng.randrange(customers),
+                rng.random() < ncr_ratio,
+                base_date + timedelta(days=document % 365),
+            )
+        customer, is_ncr, document_date = document_info[document]
+        product = rng.randrange(products)
+        quantity = rng.randint(1, 10)
+        price = round(rng.uniform(1, 500), 2)
+        discount_percentage = rng.choice((0, 0, 0, 5, 10))
+        discount = round(quantity * price * discount_percentage / 100, 2)
+        total = round(quantity * price - discount, 2)
+        sign = -1 if is_ncr else 1
+        yield {
+            'fecha': document_date.strftime('%d/%m/%Y'),
+            'comprobante': 'Nota de Crédito' if is_ncr else 'Factura',
+            'n_interno': '%s-%07d' % (prefix, document),
+            'n_fiscal': '%sF%09d' % (prefix, document),
+            'cliente_codigo': '%sC%06d' % (prefix, customer),
+            'nombre_cliente': 'Cliente %s %06d' % (prefix, customer),
+            'razon_social': 'Cliente %s %06d S.A.' % (prefix, customer),
+            'tipo_identificacion': 'RUC',
+            'identificacion': '%sID%08d' % (prefix, customer),
+            'sucursal': 'Principal',
+            'vendedor': 'Vendedor %d' % (customer % 10),
+            'codigo_articulo': '%sP%06d' % (prefix, product),
+            'nombre_articulo': 'Producto %s %06d' % (prefix, product),
+            'referencia': '',
+            'codigo_barra': '',
+            'proveedor': '',
+            'cantidad': sign * quantity,
+            'precio': sign * price,
+            'descuento': sign * discount,
+            'descuento_porcentaje': discount_percentage,
+            'subtotal_descuento': sign * total,
+            'impuesto': 0.0,
+            'impuesto_2': 0.0,
+            'total': sign * total,
+            'cuenta': '',
+            'cuenta_cxc': '',
+            'comentario': '',
+        }
+
+
+def write_csv(rows, delimiter=';'):
+    """Archivo CSV (utf-8) con las filas, como bytes"""
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=COLUMNS, delimiter=delimiter)
+    writer.writeheader()
+    writer.writerows(rows)
+    return text.getvalue().encode('utf-8')
+
+
+def write_xlsx(rows):
+    """Archivo .xlsx con las filas, como bytes"""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append([row[column] for column in COLUMNS])
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def generate_file(file_type='csv', **kwargs):
+    """Generar un archivo sintético ('csv' o 'excel'); ver ``generate_rows``"""
+    rows = generate_rows(**kwargs)
+    if file_type == 'excel':
+        return write_xlsx(rows)
+    return write_csv(rows)
@@ -0,0 +1,159 @@
+"""Benchmark de la importación masiva con archivos sintéticos.
+
+No forma parte de las pruebas estándar; se ejecuta con la etiqueta
+``invoice_import_benchmark``::
+
+    odoo-bin -d <base> -i invoice_import_massive --test-enable --stop-after-init \
+        --test-tags invoice_import_benchmark
+
+Variables de entorno:
+
+* ``INVOICE_IMPORT_BENCHMARK_SIZES``: cantidades de filas (por defecto ``1000,10000,100000``).
+* ``INVOICE_IMPORT_BENCHMARK_FILE_TYPES``: tipos de archivo (por defecto ``csv,excel``).
+* ``INVOICE_IMPORT_BENCHMARK_ENGINE``: motor de lectura (por defecto ``native``).
+* ``INVOICE_IMPORT_BENCHMARK_DOCUMENTS``, ``INVOICE_IMPORT_BENCHMARK_CUSTOMERS`` y
+  ``INVOICE_IMPORT_BENCHMARK_PRODUCTS``: cantidad de documentos, clientes y
+  productos distintos del archivo (por defecto una de cada 5, 20 y 10 filas).
+* ``INVOICE_IMPORT_BENCHMARK_NCR_RATIO``: proporción de notas de crédito
+  (por defecto ``0.1``).
+* ``INVOICE_IMPORT_BENCHMARK_TRACEMALLOC``: ``0`` para no medir la memoria;
+  tracemalloc hace más lentas las etapas que mide.
+* ``INVOICE_IMPORT_BENCHMARK_OUTPUT``: archivo donde se agregan los
+  resultados, un objeto JSON por línea. Además se registran en el log con
+  el prefijo ``INVOICE_IMPORT_BENCHMARK``.
+"""
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+from .benchmark_data import generate_file
+
+_logger = logging.getLogger(__name__)
+
+
+def _env_list(name, default):
+    return [value.strip() for value in os.environ.get(name, default).split(',') if value.strip()]
+
+
+@tagged('post_install', '-at_install', '-standard', 'invoice_import_benchmark')
+class TestInvoiceImportBenchmark(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sizes = [int(size) for size in _env_list('INVOICE_IMPORT_BENCHMARK_SIZES', '1000,10000,100000')]
+        cls.file_types = _env_list('INVOICE_IMPORT_BENCHMARK_FILE_TYPES', 'csv,excel')
+        cls.engine = os.environ.get('INVOICE_IMPORT_BENCHMARK_ENGINE', 'native')
+        cls.trace_memory = os.environ.get('INVOICE_IMPORT_BENCHMARK_TRACEMALLOC', '1') != '0'
+        cls.output = os.environ.get('INVOICE_IMPORT_BENCHMARK_OUTPUT')
+        cls.documents = int(os.environ.get('INVOICE_IMPORT_BENCHMARK_DOCUMENTS', 0))
+        cls.customers = int(os.environ.get('INVOICE_IMPORT_BENCHMARK_CUSTOMERS', 0))
+        cls.products = int(os.environ.get('INVOICE_IMPORT_BENCHMARK_PRODUCTS', 0))
+        cls.ncr_ratio = float(os.environ.get('INVOICE_IMPORT_BENCHMARK_NCR_RATIO', 0.1))
+        cls.company = cls.company_data['company']
+        cls.journal = cls.company_data['default_journal_sale']
+
+    def _measure(self, stages, stage, rows, func):
+        """Ejecutar una etapa midiendo tiempo, consultas SQL y memoria máxima"""
+        cr = self.env.cr
+        if self.trace_memory:
+            tracemalloc.start()
+        queries = cr.sql_log_count
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        stages[stage] = {
+            'seconds': round(seconds, 4),
+            'queries': cr.sql_log_count - queries,
+            'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        }
+        if self.trace_memory:
+            stages[stage]['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+        return result
+
+    def _run_benchmark(self, rows, file_type):
+        """Importar un archivo sintético de ``rows`` filas con el mismo flujo que el asistente
+        
+        Se mide la carga desde el adjunto (lectura, normalización e
+        inserción intercaladas por lote) y el procesamiento completo; el
+        detalle por etapa sale de las estadísticas que guarda la importación.
+        """
+        prefix = 'BM%s%s' % (file_type[0].upper(), rows)
+        file_name = 'benchmark.%s' % ('xlsx' if file_type == 'excel' else 'csv')
+        content = generate_file(file_type, rows=rows, documents=self.documents or rows // 5,
+                                customers=self.customers or max(rows // 20, 1),
+                                products=self.products or max(rows // 10, 1),
+                                ncr_ratio=self.ncr_ratio, prefix=prefix)
+        import_record = self.env['invoice.import'].create({
+            'name': 'Benchmark %s %s' % (file_type, rows),
+            'file_name': file_name,
+            'file_type': file_type,
+            'company_id': self.company.id,
+            'journal_id': self.journal.id,
+            'reader_engine': self.engine,
+        })
+        import_record.attachment_id = self.env['ir.attachment'].create({
+            'name': file_name,
+            'raw': content,
+            'res_model': import_record._name,
+            'res_id': import_record.id,
+        })
+        stages = {}
+
+        def process():
+            import_record.write({'state': 'processing'})
+            import_record._process_pending_lines()
+
+        self._measure(stages, 'load', rows, import_record._stage_from_attachment)
+        self._measure(stages, 'process', rows, process)
+
+        self.assertEqual(import_record.imported_lines, rows)
+        return {
+            'module_version': self.env.ref('base.module_invoice_import_massive').latest_version,
+            'file_type': file_type,
+            'engine': self.engine,
+            'rows': rows,
+            'file_size': len(content),
+            'documents': len(import_record.import_line_ids.invoice_id),
+            'new_partners': import_record.created_partner_count,
+            'new_products': import_record.created_product_count,
+            'total_seconds': round(sum(values['seconds'] for values in stages.values()), 4),
+            'total_queries': sum(values['queries'] for values in stages.values()),
+            'stages': stages,
+            'pipeline_stages': self._pipeline_stages(import_record),
+        }
+
+    def _pipeline_stages(self, import_record):
+        """Mediciones por etapa guardadas por la importación (sumando bloques)"""
+        groups = self.env['invoice.import.stat']._read_group(
+            [('import_id', '=', import_record.id)],
+            ['stage'],
+            ['seconds:sum', 'query_count:sum', 'row_count:sum'],
+        )
+        return {
+            stage: {'seconds': round(seconds, 4), 'queries': query_count, 'rows': row_count}
+            for stage, seconds, query_count, row_count in groups
+        }
+
+    def _emit_results(self, results):
+        """Registrar los resultados en el log y, si se indicó, en el archivo de salida"""
+        for result in results:
+            _logger.info("INVOICE_IMPORT_BENCHMARK %s", json.dumps(result, sort_keys=True))
+        if self.output:
+            with open(self.output, 'a', encoding='utf-8') as output:
+                for result in results:
+                    output.write(json.dumps(result, sort_keys=True) + '\n')
+
+    def test_import_benchmark(self):
+        results = []
+        for file_type in self.file_types:
+            for rows in self.sizes:
+                with self.subTest(file_type=file_type, rows=rows):
+                    results.append(self._run_benchmark(rows, file_type))
+        self._emit_results(results)
@@ -0,0 +1,95 @@
+import io
+import unittest
+from datetime import date, datetime
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools import file_reader, line_normalizer
+from ..tools.date_parser import DateParser
+from .benchmark_data import generate_rows, write_csv
+
+
+@tagged('post_install', '-at_install')
+class TestInvoiceImportNormalization(TransactionCase):
+
+    def test_infer_date_format(self):
+        """El formato de fecha se deduce de la muestra y se aplica a todo el archivo"""
+        parser = DateParser()
+        dates, errors = parser.parse(['02/13/2024', '01/02/2024'], date(2024, 6, 1))
+        self.assertEqual(parser.format, '%m/%d/%Y')
+        self.assertEqual(dates, [date(2024, 2, 13), date(2024, 1, 2)])
+        self.assertFalse(errors)
+
+    def test_infer_date_format_tie(self):
+        """En caso de empate gana el formato de mayor prioridad (día/mes/año)"""
+        parser = DateParser()
+        dates, dummy = parser.parse(['01/02/2024', '03/04/2024'], date(2024, 6, 1))
+        self.assertEqual(parser.format, '%d/%m/%Y')
+        self.assertEqual(dates, [date(2024, 2, 1), date(2024, 4, 3)])
+
+    def test_date_format_kept_between_batches(self):
+        """El formato inferido en el primer lote se conserva en los siguientes"""
+        parser = DateParser()
+        parser.parse(['02/13/2024'], date(2024, 6, 1))
+        dates, dummy = parser.parse(['01/02/2024'], date(2024, 6, 1))
+        self.assertEqual(dates, [date(2024, 1, 2)])
+
+    def test_empty_and_excel_dates(self):
+        """Los vacíos toman la fecha por defecto y las celdas de Excel se aceptan tal cual"""
+        default_date = date(2024, 6, 1)
+        dates, errors = DateParser().parse([None, '', date(2024, 3, 1), datetime(2024, 3, 2, 10, 30)], default_date)
+        self.assertEqual(dates, [default_date, default_date, date(2024, 3, 1), date(2024, 3, 2)])
+        self.assertFalse(errors)
+
+    def test_invalid_date_is_line_error(self):
+        """Una fecha que no se puede interpretar deja la línea con error en lugar de usar la fecha del día"""
+        rows = [
+            {'fecha': '2024-01-05', 'comprobante': 'Factura'},
+            {'fecha': '31/31/2024', 'comprobante': 'Factura'},
+        ]
+        lines = self.env['invoice.import']._prepare_lines_data(rows, 1)
+        self.assertEqual(lines[0]['state'], 'draft')
+        self.assertEqual(lines[0]['fecha'], date(2024, 1, 5))
+        self.assertEqual(lines[1]['state'], 'error')
+        self.assertFalse(lines[1]['fecha'])
+        self.assertIn('31/31/2024', lines[1]['error_message'])
+
+    def test_ncr_amounts_are_positive(self):
+        """Las notas de crédito se importan con cantidades e importes positivos"""
+        rows = [
+            {'fecha': '2024-01-05', 'comprobante': 'Nota de Crédito', 'cantidad': '-2', 'precio': '-10', 'total': '-20'},
+            {'fecha': '2024-01-05', 'comprobante': 'Factura', 'cantidad': '2', 'precio': '-10', 'total': '-20'},
+        ]
+        lines, dummy, dummy = line_normalizer.normalize_rows(rows)
+        self.assertEqual((lines[0]['quantity'], lines[0]['precio'], lines[0]['total']), (2.0, 10.0, 20.0))
+        self.assertEqual((lines[1]['quantity'], lines[1]['precio'], lines[1]['total']), (2.0, -10.0, -20.0))
+        Line = self.env['invoice.import.line']
+        self.assertEqual(Line._get_move_type_from_comprobante('Nota de Crédito'), 'out_refund')
+        self.assertEqual(Line._get_move_type_from_comprobante('FACTURA'), 'out_invoice')
+
+    def test_semicolon_csv_with_decimal_comma(self):
+        """Los CSV separados por ``;`` se detectan y aceptan coma decimal"""
+        content = 'fecha;comprobante;cantidad;precio;total\n05/01/2024;Factura;1;117,10;1.234,56\n'.encode('utf-8')
+        self.assertEqual(file_reader.sniff_delimiter(io.BytesIO(content)), ';')
+        rows = list(file_reader.iter_csv_rows(io.BytesIO(content)))
+        lines, dummy, number_errors = line_normalizer.normalize_rows(rows)
+        self.assertEqual(lines[0]['precio'], 117.10)
+        self.assertEqual(lines[0]['total'], 1234.56)
+        self.assertFalse(number_errors)
+
+    def test_invalid_number_is_line_error(self):
+        """Un número que no se puede interpretar deja la línea con error"""
+        rows = [{'fecha': '2024-01-05', 'comprobante': 'Factura', 'precio': 'diez'}]
+        lines = self.env['invoice.import']._prepare_lines_data(rows, 1)
+        self.assertEqual(lines[0]['state'], 'error')
+        self.assertIn('diez', lines[0]['error_message'])
+
+    @unittest.skipUnless(file_reader.pandas_available(), "pandas no está instalado")
+    def test_engines_parity(self):
+        """Los motores ``native`` y ``pandas`` leen y normalizan el archivo igual"""
+        content = write_csv(generate_rows(rows=200, ncr_ratio=0.3))
+        results = {}
+        for engine in ('native', 'pandas'):
+            rows = list(file_reader.iter_rows(io.BytesIO(content), 'csv', engine))
+            results[engine] = line_normalizer.normalize_rows(rows, 1, date(2024, 6, 1), engine=engine)
+        self.assertEqual(results['native'], results['pandas'])
@@ -0,0 +1,214 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestInvoiceImportPipeline(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.company_data['company']
+        cls.journal = cls.company_data['default_journal_sale']
+
+    def _row(self, **values):
+        """Fila del archivo con valores por defecto (una línea de factura)"""
+        row = {
+            'fecha': '2024-01-05',
+            'comprobante': 'Factura',
+            'n_interno': 'INT-1',
+            'n_fiscal': 'F-1',
+            'cliente_codigo': 'CLI-1',
+            'nombre_cliente': 'Cliente Uno',
+            'razon_social': 'Cliente Uno S.A.',
+            'codigo_articulo': 'ART-1',
+            'nombre_articulo': 'Artículo Uno',
+            'cantidad': '1',
+            'precio': '100',
+        }
+        row.update(values)
+        return row
+
+    def _create_import(self, **values):
+        return self.env['invoice.import'].create(dict({
+            'name': 'Prueba',
+            'file_name': 'prueba.csv',
+            'file_type': 'csv',
+            'company_id': self.company.id,
+            'journal_id': self.journal.id,
+        }, **values))
+
+    def _import(self, rows, **values):
+        """Cargar las filas y procesarlas con el mismo flujo que el asistente"""
+        import_record = self._create_import(**values)
+        import_record.total_lines = import_record._stage_lines(iter(rows))
+        import_record.write({'state': 'processing'})
+        import_record._process_pending_lines()
+        return import_record
+
+    def test_one_move_per_document(self):
+        """Las filas de un mismo documento se agrupan en una sola factura"""
+        import_record = self._import([
+            self._row(),
+            self._row(codigo_articulo='ART-2', nombre_articulo='Artículo Dos', precio='50'),
+            self._row(n_interno='INT-2', n_fiscal='F-2'),
+            self._row(comprobante='Nota de Crédito', n_interno='NCR-1', n_fiscal='N-1', cantidad='-1', precio='-30'),
+        ])
+        lines = import_record.import_line_ids
+        self.assertEqual(set(lines.mapped('state')), {'imported'})
+        self.assertEqual(import_record.state, 'imported')
+        self.assertEqual(import_record.imported_lines, 4)
+
+        moves = lines.invoice_id
+        self.assertEqual(len(moves), 3)
+        first_move = lines.filtered(lambda l: l.n_interno == 'INT-1').invoice_id
+        self.assertEqual(len(first_move), 1)
+        self.assertEqual(len(first_move.invoice_line_ids), 2)
+        self.assertEqual(first_move.amount_untaxed, 150.0)
+        self.assertEqual(first_move.ref, 'INT-1')
+
+        refund = lines.filtered(lambda l: l.n_interno == 'NCR-1').invoice_id
+        self.assertEqual(refund.move_type, 'out_refund')
+        self.assertEqual(refund.amount_untaxed, 30.0)
+
+    def test_batch_create_falls_back_per_document(self):
+        """Si la creación en bloque falla, solo el documento con problemas queda con error"""
+        deprecated_account = self.env['account.account'].create({
+            'name': 'Ingresos obsoletos',
+            'code': '999001',
+            'account_type': 'income',
+            'deprecated': True,
+        })
+        import_record = self._import([
+            self._row(),
+            self._row(n_interno='INT-2', n_fiscal='F-2', cuenta=deprecated_account.code),
+            self._row(n_interno='INT-3', n_fiscal='F-3'),
+        ])
+        lines = import_record.import_line_ids
+        failed_line = lines.filtered(lambda l: l.n_interno == 'INT-2')
+        self.assertEqual(failed_line.state, 'error')
+        self.assertFalse(failed_line.invoice_id)
+        self.assertTrue(failed_line.error_message)
+        self.assertEqual((lines - failed_line).mapped('state'), ['imported', 'imported'])
+        self.assertEqual(len(lines.invoice_id), 2)
+        self.assertEqual(import_record.state, 'error')
+        self.assertEqual(import_record.error_lines, 1)
+
+    def test_partner_resolution(self):
+        """Los clientes se buscan sin distinguir mayúsculas y los nuevos se crean una sola vez"""
+        existing_partner = self.env['res.partner'].create({
+            'name': 'Cliente Existente',
+            'company_id': self.company.id,
+        })
+        import_record = self._import([
+            self._row(cliente_codigo='', nombre_cliente='CLIENTE EXISTENTE'),
+            self._row(n_interno='INT-2', n_fiscal='F-2', cliente_codigo='CLI-NUEVO', nombre_cliente='Cliente Nuevo'),
+            self._row(n_interno='INT-3', n_fiscal='F-3', cliente_codigo='CLI-NUEVO', nombre_cliente='Cliente Nuevo'),
+            self._row(n_interno='INT-4', n_fiscal='F-4', cliente_codigo='', nombre_cliente='cliente nuevo'),
+        ])
+        lines = import_record.import_line_ids.sorted('line_number')
+        self.assertEqual(set(lines.mapped('state')), {'imported'})
+        self.assertEqual(lines[0].partner_id, existing_partner)
+        self.assertEqual(import_record.created_partner_count, 1)
+        new_partner = import_record.created_partner_ids
+        self.assertEqual(new_partner.ref, 'CLI-NUEVO')
+        self.assertEqual(lines[1:].partner_id, new_partner)
+
+    def test_bulk_insert_staging_lines(self):
+        """Las líneas se insertan con todas sus columnas y el subtotal con descuento calculado"""
+        import_record = self._create_import()
+        vals_list = self.env['invoice.import']._prepare_lines_data([
+            self._row(cantidad='2', precio='50', descuento='10'),
+            self._row(cantidad='2', precio='50', descuento_porcentaje='20', comentario='Con porcentaje'),
+            self._row(fecha='no es fecha'),
+        ], 1)
+        self.env['invoice.import.line']._bulk_insert(import_record, vals_list)
+
+        lines = import_record.import_line_ids.sorted('line_number')
+        self.assertEqual(lines.mapped('line_number'), [1, 2, 3])
+        self.assertEqual(lines.company_id, self.company)
+        self.assertEqual(lines.mapped('subtotal_descuento'), [90.0, 80.0, 100.0])
+        self.assertEqual(lines[0].nombre_cliente, 'Cliente Uno')
+        self.assertEqual(lines[1].comentario, 'Con porcentaje')
+        self.assertEqual(lines.mapped('state'), ['draft', 'draft', 'error'])
+        self.assertFalse(lines[2].fecha)
+        self.assertIn('no es fecha', lines[2].error_message)
+        self.assertEqual(lines[0].create_uid, self.env.user)
+
+    def test_discount_totals(self):
+        """Los totales de descuento de la importación se agregan desde las líneas"""
+        import_record = self._import([
+            self._row(cantidad='2', precio='50', descuento='10'),
+            self._row(n_interno='INT-2', n_fiscal='F-2', cantidad='1', precio='200', descuento_porcentaje='20'),
+            self._row(n_interno='INT-3', n_fiscal='F-3'),
+        ])
+        self.assertEqual(import_record.state, 'imported')
+        self.assertAlmostEqual(import_record.total_discount_amount, 50.0)
+        self.assertAlmostEqual(import_record.total_discount_percentage, 15.0)
+        move = import_record.import_line_ids.filtered(lambda l: l.n_interno == 'INT-1').invoice_id
+        self.assertAlmostEqual(move.invoice_line_ids.discount, 10.0)
+        self.assertAlmostEqual(move.amount_untaxed, 90.0)
+
+    def test_skip_already_imported_documents(self):
+        """Al importar de nuevo los mismos documentos, sus líneas se omiten y se enlazan a la factura existente"""
+        rows = [self._row(), self._row(n_interno='INT-2', n_fiscal='F-2')]
+        first_import = self._import(rows)
+        moves = first_import.import_line_ids.invoice_id
+        self.assertEqual(len(moves), 2)
+
+        second_import = self._import(rows + [self._row(n_interno='INT-3', n_fiscal='F-3')], skip_duplicates=True)
+        lines = second_import.import_line_ids.sorted('line_number')
+        self.assertEqual(lines.mapped('state'), ['skipped', 'skipped', 'imported'])
+        self.assertEqual(lines[:2].invoice_id, moves)
+        self.assertNotIn(lines[2].invoice_id, moves)
+        self.assertEqual(second_import.skipped_lines, 2)
+        self.assertEqual(second_import.imported_lines, 1)
+        self.assertEqual(second_import.state, 'imported')
+
+    def test_resume_processes_only_failed_lines(self):
+        """Al retomar se vuelven a procesar las líneas con error sin duplicar las facturas ya creadas"""
+        account = self.env['account.account'].create({
+            'name': 'Ingresos temporales',
+            'code': '999002',
+            'account_type': 'income',
+            'deprecated': True,
+        })
+        import_record = self._import([
+            self._row(),
+            self._row(n_interno='INT-2', n_fiscal='F-2', cuenta=account.code),
+        ])
+        self.assertEqual(import_record.state, 'error')
+        first_move = import_record.import_line_ids.invoice_id
+        self.assertEqual(len(first_move), 1)
+
+        account.deprecated = False
+        import_record.action_resume()
+        self.assertEqual(import_record.state, 'processing')
+        self.assertEqual(import_record.processed_lines, 1)
+        import_record._process_pending_lines()
+
+        lines = import_record.import_line_ids
+        self.assertEqual(set(lines.mapped('state')), {'imported'})
+        self.assertEqual(len(lines.invoice_id), 2)
+        self.assertIn(first_move, lines.invoice_id)
+        self.assertEqual(import_record.state, 'imported')
+        self.assertEqual(import_record.imported_lines, 2)
+        self.assertEqual(import_record.error_lines, 0)
+
+    def test_parse_errors_survive_resume(self):
+        """Una línea con un número ilegible nunca se factura, ni siquiera al retomar"""
+        import_record = self._import([
+            self._row(),
+            self._row(n_interno='INT-2', n_fiscal='F-2', precio='diez'),
+        ])
+        failed_line = import_record.import_line_ids.filtered(lambda l: l.n_interno == 'INT-2')
+        self.assertEqual(failed_line.state, 'error')
+        message = failed_line.error_message
+        self.assertIn('diez', message)
+
+        import_record.action_resume()
+        import_record._process_pending_lines()
+        self.assertEqual(failed_line.state, 'error')
+        self.assertEqual(failed_line.error_message, message)
+        self.assertFalse(failed_line.invoice_id)
+        self.assertEqual(import_record.error_lines, 1)
@@ -0,0 +1,4 @@
+from . import date_parser
+from . import file_reader
+from . import line_normalizer
+from . import stage_timer
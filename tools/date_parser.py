@@ -0,0 +1,111 @@
+"""Interpretación de la columna fecha con inferencia del formato por archivo.
+
+El formato se deduce una sola vez a partir de una muestra de la columna y
+luego se aplica a toda la columna (con una llamada vectorizada de pandas si
+se usa ese motor, o con ``datetime.strptime`` si no). Solo los valores que
+no cumplen ese formato se prueban con los demás formatos; los que no se
+pueden interpretar se informan como errores en lugar de reemplazarse por la
+fecha del día.
+"""
+from datetime import date, datetime
+
+# Formatos de fecha aceptados, en orden de prioridad
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S']
+
+
+def _is_empty(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+
+class DateParser:
+    """Intérprete de fechas que conserva el formato inferido entre lotes del mismo archivo"""
+
+    def __init__(self, formats=None, sample_size=200, engine='native'):
+        self.formats = formats or DATE_FORMATS
+        self.sample_size = sample_size
+        self.engine = engine
+        self.format = None
+
+    def infer_format(self, values):
+        """Elegir el formato que interpreta más valores de la muestra
+        
+        En caso de empate gana el formato de mayor prioridad.
+        """
+        sample = [value.strip() for value in values if isinstance(value, str) and value.strip()][:self.sample_size]
+        if not sample:
+            return None
+        best_format, best_count = None, 0
+        for fmt in self.formats:
+            count = 0
+            for value in sample:
+                try:
+                    datetime.strptime(value, fmt)
+                    count += 1
+                except ValueError:
+                    continue
+            if count > best_count:
+                best_format, best_count = fmt, count
+        return best_format
+
+    @staticmethod
+    def _parse_text(text, fmt):
+        """Interpretar un texto con un formato; None si no lo cumple"""
+        if not text:
+            return None
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            return None
+
+    def _parse_with_pandas(self, texts):
+        """Interpretar los textos con el formato del archivo en una llamada vectorizada"""
+        import pandas as pd
+        parsed = pd.to_datetime(pd.Series(texts, dtype=object), format=self.format, errors='coerce')
+        return [None if value is pd.NaT else value.date() for value in parsed.tolist()]
+
+    def _parse_value(self, value):
+        """Interpretar un valor suelto probando todos los formatos"""
+        for fmt in self.formats:
+            parsed_date = self._parse_text(value, fmt)
+            if parsed_date is not None:
+                return parsed_date
+        return None
+
+    def parse(self, values, default_date):
+        """Interpretar una lista de valores de fecha
+        
+        Los vacíos toman ``default_date``. Retorna una tupla (fechas, errores)
+        donde las fechas no interpretables quedan en False y ``errores`` es
+        un diccionario posición -> valor original.
+        """
+        values = list(values)
+        if self.format is None:
+            self.format = self.infer_format(values)
+        
+        texts = [value.strip() if isinstance(value, str) else None for value in values]
+        if not self.format:
+            parsed = [None] * len(values)
+        elif self.engine == 'pandas':
+            parsed = self._parse_with_pandas(texts)
+        else:
+            parsed = [self._parse_text(text, self.format) for text in texts]
+        
+        dates = []
+        errors = {}
+        for position, (value, parsed_value) in enumerate(zip(values, parsed)):
+            if _is_empty(value) or (isinstance(value, str) and not value.strip()):
+                dates.append(default_date)
+            elif parsed_value is not None:
+                dates.append(parsed_value)
+            elif isinstance(value, datetime):
+                dates.append(value.date())
+            elif isinstance(value, date):
+                # Celdas de Excel con solo la fecha
+                dates.append(value)
+            else:
+                # Valor fuera del formato del archivo: interpretar por separado
+                parsed_date = self._parse_value(value.strip()) if isinstance(value, str) else None
+                if parsed_date is None:
+                    errors[position] = value
+                dates.append(parsed_date or False)
+        return dates, errors
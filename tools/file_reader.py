@@ -0,0 +1,179 @@
+"""Lectura por streaming de archivos Excel/CSV de importación.
+
+Los lectores recorren el archivo fila por fila, sin cargar toda la hoja
+en memoria, y entregan cada fila como un diccionario columna -> valor.
+
+Hay dos motores de lectura:
+
+* ``native``: módulo ``csv`` de la biblioteca estándar (con detección del
+  separador ``,`` o ``;``) y openpyxl en modo solo lectura para .xlsx.
+  No importa pandas.
+* ``pandas``: ``pandas.read_csv`` por partes y ``pandas.read_excel``. Es
+  opcional; solo conviene para archivos CSV grandes, donde su parser
+  compensa el costo de importarlo.
+"""
+import csv
+import hashlib
+import importlib.util
+import io
+import logging
+from itertools import islice
+
+_logger = logging.getLogger(__name__)
+
+# Valores que se consideran vacíos (equivalentes a los na_values usados con pandas)
+NA_VALUES = {'', 'nan', 'NaN', 'null', 'NULL'}
+
+# Separadores de CSV aceptados
+CSV_DELIMITERS = ',;'
+
+# Tamaño a partir del cual el motor automático usa pandas para los CSV
+PANDAS_CSV_MIN_SIZE = 20 * 1024 * 1024
+
+
+def clean_header(name):
+    """Limpiar nombres de columnas (quitar espacios y caracteres especiales)"""
+    return str(name if name is not None else '').strip().replace('\xa0', '')
+
+
+def _clean_cell(value):
+    if isinstance(value, str) and value.strip() in NA_VALUES:
+        return None
+    return value
+
+
+def iter_xlsx_rows(fileobj):
+    """Recorrer la primera hoja de un archivo .xlsx en modo solo lectura"""
+    import openpyxl
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [clean_header(name) for name in next(rows, ())]
+        for values in rows:
+            values = [_clean_cell(value) for value in values]
+            # Omitir filas completamente vacías
+            if all(value is None for value in values):
+                continue
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def sniff_delimiter(fileobj, encoding='utf-8-sig', sample_size=64 * 1024):
+    """Detectar el separador (``,`` o ``;``) con una muestra del inicio del archivo
+    
+    El archivo vuelve a quedar en la posición en que estaba.
+    """
+    position = fileobj.tell()
+    sample = fileobj.read(sample_size).decode(encoding, errors='ignore')
+    fileobj.seek(position)
+    # No pasar al detector una última línea cortada
+    if '\n' in sample:
+        sample = sample[:sample.rfind('\n') + 1]
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+def iter_csv_rows(fileobj, encoding='utf-8-sig', delimiter=None):
+    """Recorrer un archivo CSV de forma incremental (utf-8-sig ignora el BOM si existe)
+    
+    Si no se indica ``delimiter`` se detecta a partir del contenido.
+    """
+    if delimiter is None:
+        delimiter = sniff_delimiter(fileobj, encoding)
+    text = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    reader = csv.reader(text, delimiter=delimiter)
+    header = [clean_header(name) for name in next(reader, ())]
+    for values in reader:
+        values = [_clean_cell(value) for value in values]
+        if all(value is None for value in values):
+            continue
+        yield dict(zip(header, values))
+
+
+def iter_pandas_rows(fileobj, file_type, encoding='utf-8-sig', chunk_size=10000):
+    """Recorrer el archivo con pandas (CSV por partes de ``chunk_size`` filas)"""
+    import pandas as pd
+    if file_type == 'excel':
+        frames = [pd.read_excel(fileobj, dtype=object, keep_default_na=False)]
+    else:
+        frames = pd.read_csv(
+            fileobj, sep=sniff_delimiter(fileobj, encoding), dtype=str, encoding=encoding,
+            keep_default_na=False, chunksize=chunk_size,
+        )
+    for frame in frames:
+        header = [clean_header(name) for name in frame.columns]
+        frame = frame.astype(object).where(frame.notna(), None)
+        for values in frame.itertuples(index=False, name=None):
+            values = [_clean_cell(value) for value in values]
+            if all(value is None for value in values):
+                continue
+            yield dict(zip(header, values))
+
+
+def pandas_available():
+    """pandas está instalado (sin importarlo)"""
+    return importlib.util.find_spec('pandas') is not None
+
+
+def choose_engine(file_type, file_size, engine='auto'):
+    """Elegir el motor de lectura ('native' o 'pandas')
+    
+    En modo ``auto`` se usa pandas solo para los CSV de al menos
+    ``PANDAS_CSV_MIN_SIZE`` bytes; los .xlsx siempre se leen con openpyxl
+    en modo solo lectura, que usa menos memoria que ``read_excel``. Si se
+    pide pandas y no está instalado se usa el motor nativo.
+    """
+    if engine == 'auto':
+        engine = 'pandas' if file_type == 'csv' and (file_size or 0) >= PANDAS_CSV_MIN_SIZE else 'native'
+    if engine == 'pandas' and not pandas_available():
+        _logger.warning("pandas no está instalado, se usa el lector nativo")
+        engine = 'native'
+    return engine
+
+
+def iter_rows(fileobj, file_type, engine='native'):
+    """Recorrer las filas del archivo según su tipo ('excel' o 'csv') y el motor"""
+    if engine == 'pandas':
+        return iter_pandas_rows(fileobj, file_type)
+    if file_type == 'excel':
+        return iter_xlsx_rows(fileobj)
+    return iter_csv_rows(fileobj)
+
+
+def open_attachment(attachment):
+    """Abrir el contenido de un ``ir.attachment`` como archivo binario
+    
+    Si el adjunto está en el filestore se abre el archivo directamente, sin
+    cargar su contenido en memoria; si está en la base de datos se usa una
+    copia en memoria.
+    """
+    if attachment.store_fname:
+        return open(attachment._full_path(attachment.store_fname), 'rb')
+    return io.BytesIO(attachment.raw or b'')
+
+
+def iter_attachment_rows(attachment, file_type, engine='native'):
+    """Recorrer las filas de un adjunto, manteniendo el archivo abierto mientras se lee"""
+    with open_attachment(attachment) as fileobj:
+        yield from iter_rows(fileobj, file_type, engine)
+
+
+def file_digest(fileobj, chunk_size=1024 * 1024):
+    """SHA-256 del contenido de un archivo, leído por partes"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def batched(iterable, size):
+    """Agrupar un iterable en listas de a lo sumo ``size`` elementos"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
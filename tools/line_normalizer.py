@@ -0,0 +1,175 @@
+"""Normalización por columnas de las filas leídas del archivo.
+
+Convierte un lote de filas (diccionarios columna -> valor) en los valores
+de ``invoice.import.line`` trabajando columna por columna, en lugar de
+limpiar cada fila por separado. Con el motor ``pandas`` se usan operaciones
+vectorizadas; con el motor ``native`` las mismas reglas se aplican en Python
+puro, sin importar pandas.
+"""
+from datetime import date
+
+from .date_parser import DateParser
+
+# Columnas de texto del archivo, en el orden de invoice.import.line
+TEXT_COLUMNS = [
+    'comprobante', 'n_interno', 'n_fiscal', 'cliente_codigo', 'nombre_cliente',
+    'razon_social', 'tipo_identificacion', 'identificacion', 'sucursal', 'vendedor',
+    'codigo_articulo', 'nombre_articulo', 'referencia', 'codigo_barra', 'proveedor',
+    'cuenta', 'cuenta_cxc',
+]
+
+# Columnas numéricas cuyo signo se invierte (a positivo) en las notas de crédito
+NCR_COLUMNS = ['precio', 'descuento', 'descuento_porcentaje', 'total']
+
+# Columnas numéricas que se copian tal cual
+NUMBER_COLUMNS = ['subtotal_descuento', 'impuesto', 'impuesto_2']
+
+def _text(frame, column):
+    """Columna como texto; los vacíos quedan como ''"""
+    import pandas as pd
+    if column not in frame:
+        return pd.Series('', index=frame.index, dtype=object)
+    return frame[column].fillna('').astype(str)
+
+
+def _number(frame, column, number_errors, default=0.0):
+    """Columna como número; los vacíos toman ``default``
+    
+    Los valores que no son números toman ``default`` y se agregan a
+    ``number_errors`` (posición -> {columna: valor original}).
+    """
+    import pandas as pd
+    if column not in frame:
+        return pd.Series(default, index=frame.index, dtype=float)
+    values = frame[column]
+    numbers = pd.to_numeric(values, errors='coerce').astype(float)
+    # Solo los valores que pandas no entiende (p. ej. con coma decimal) se convierten en Python
+    retry = numbers.isna() & values.notna()
+    if retry.any():
+        numbers.loc[retry] = pd.to_numeric(values[retry].map(_to_number), errors='coerce').astype(float)
+        for position, value in values[numbers.isna() & values.notna()].items():
+            number_errors.setdefault(position, {})[column] = value
+    return numbers.fillna(default)
+
+
+def _to_text(value):
+    return '' if value is None else str(value)
+
+
+def _to_number(value, default=0.0):
+    """Valor como número; los vacíos toman ``default`` y los inválidos None
+    
+    Acepta coma decimal ("117,10", "1.234,56") además de punto decimal con
+    o sin separador de miles ("1,234.56").
+    """
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        value = value.strip()
+        if ',' in value:
+            if '.' in value and value.rfind('.') > value.rfind(','):
+                value = value.replace(',', '')
+            elif value.count(',') == 1:
+                value = value.replace('.', '').replace(',', '.')
+            else:
+                value = value.replace(',', '')
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return default if number != number else number
+
+
+def _row_number(row, column, invalid, default=0.0):
+    """Número de una columna de la fila; si no es un número se agrega a ``invalid``"""
+    value = row.get(column)
+    number = _to_number(value, default)
+    if number is None:
+        invalid[column] = value
+        return default
+    return number
+
+
+def _is_ncr(comprobante):
+    """El comprobante NO contiene "factura" (sin distinguir tildes)"""
+    return comprobante != '' and 'factura' not in comprobante.lower().replace('é', 'e')
+
+
+def normalize_rows(rows, first_line_number=1, default_date=None, date_parser=None, engine='native'):
+    """Convertir un lote de filas en los valores de las líneas (NCR en positivo)
+    
+    Retorna (valores, fechas inválidas posición -> valor, números inválidos posición -> {columna: valor}).
+    """
+    if not rows:
+        return [], {}, {}
+    default_date = default_date or date.today()
+    date_parser = date_parser or DateParser(engine=engine)
+    if engine == 'pandas':
+        return _normalize_with_pandas(rows, first_line_number, default_date, date_parser)
+    
+    dates, date_errors = date_parser.parse([row.get('fecha') for row in rows], default_date)
+    number_errors = {}
+    lines = []
+    for position, (row, fecha) in enumerate(zip(rows, dates)):
+        line = {'line_number': first_line_number + position, 'fecha': fecha}
+        for column in TEXT_COLUMNS:
+            line[column] = _to_text(row.get(column))
+        is_ncr = _is_ncr(line['comprobante'])
+        invalid = {}
+        
+        # Cantidad: si viene vacía o en 0 se usa 1.0
+        quantity = _row_number(row, 'cantidad', invalid, 1.0) or 1.0
+        line['quantity'] = abs(quantity) if is_ncr else quantity
+        for column in NCR_COLUMNS:
+            value = _row_number(row, column, invalid)
+            line[column] = abs(value) if is_ncr else value
+        for column in NUMBER_COLUMNS:
+            line[column] = _row_number(row, column, invalid)
+        line['comentario'] = _to_text(row.get('comentario'))
+        line['state'] = 'draft'
+        lines.append(line)
+        if invalid:
+            number_errors[position] = invalid
+    return lines, date_errors, number_errors
+
+
+def _normalize_with_pandas(rows, first_line_number, default_date, date_parser):
+    """``normalize_rows`` con operaciones vectorizadas de pandas"""
+    import pandas as pd
+    frame = pd.DataFrame(rows, dtype=object)
+    
+    if 'fecha' in frame:
+        dates, date_errors = date_parser.parse(frame['fecha'].tolist(), default_date)
+    else:
+        dates, date_errors = [default_date] * len(frame), {}
+    
+    columns = {
+        'line_number': range(first_line_number, first_line_number + len(frame)),
+        'fecha': dates,
+    }
+    for column in TEXT_COLUMNS:
+        columns[column] = _text(frame, column).tolist()
+    
+    # Detectar NCR: el comprobante NO contiene "factura" (sin distinguir tildes)
+    comprobante = _text(frame, 'comprobante')
+    is_ncr = (comprobante != '') & ~comprobante.str.lower().str.replace('é', 'e', regex=False).str.contains('factura', regex=False)
+    
+    # Cantidad: si viene vacía o en 0 se usa 1.0
+    number_errors = {}
+    quantity = _number(frame, 'cantidad', number_errors, 1.0)
+    quantity = quantity.mask(quantity == 0, 1.0)
+    columns['quantity'] = quantity.mask(is_ncr, quantity.abs()).tolist()
+    for column in NCR_COLUMNS:
+        values = _number(frame, column, number_errors)
+        columns[column] = values.mask(is_ncr, values.abs()).tolist()
+    for column in NUMBER_COLUMNS:
+        columns[column] = _number(frame, column, number_errors).tolist()
+    columns['comentario'] = _text(frame, 'comentario').tolist()
+    
+    names = list(columns)
+    lines = []
+    for values in zip(*columns.values()):
+        line = dict(zip(names, values))
+        line['state'] = 'draft'
+        lines.append(line)
+    return lines, date_errors, number_errors
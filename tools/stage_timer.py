@@ -0,0 +1,49 @@
+"""Medición por etapa del procesamiento de una importación.
+
+``StageTimer`` acumula, para cada etapa, el tiempo, las consultas SQL
+(``cr.sql_log_count``) y las filas procesadas. Los valores acumulados se
+guardan en la importación con ``invoice.import._save_stage_stats``.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class StageTimer:
+    """Acumulador de tiempo, consultas y filas por etapa"""
+
+    def __init__(self, env):
+        self.env = env
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage, rows=0):
+        """Medir un bloque de código como parte de la etapa ``stage``
+        
+        Antes de detener el reloj se escriben en la base de datos los cambios
+        pendientes del ORM, para que su costo quede en la etapa que los generó.
+        Retorna un diccionario en el que se puede indicar ``rows`` al final.
+        """
+        cr = self.env.cr
+        counter = {'rows': rows}
+        queries = cr.sql_log_count
+        start = time.perf_counter()
+        yield counter
+        self.env.flush_all()
+        values = self.stages.setdefault(stage, {'seconds': 0.0, 'queries': 0, 'rows': 0, 'calls': 0})
+        values['seconds'] += time.perf_counter() - start
+        values['queries'] += cr.sql_log_count - queries
+        values['rows'] += counter['rows']
+        values['calls'] += 1
+
+    def pop(self):
+        """Retornar los valores acumulados y empezar de nuevo"""
+        stages, self.stages = self.stages, {}
+        return stages
+
+
+def measure(import_ctx, stage, rows=0):
+    """Medir con el ``StageTimer`` del contexto de la importación, si lo hay"""
+    timer = import_ctx and import_ctx.get('stats')
+    if not timer:
+        return nullcontext({'rows': rows})
+    return timer.measure(stage, rows)